@@ -0,0 +1,97 @@
+import gzip
+import json
+import os
+import uuid
+from datetime import date, datetime, time
+from typing import Iterable, Iterator
+
+ATTENDANCE_COLUMNS = ["id", "roll", "date", "time", "arrival_time", "late", "status"]
+# The PIN hash is deliberately not archived
+STUDENT_COLUMNS = ["roll", "name", "branch", "dob", "issue_valid", "valid_until", "photo", "photo_public_id", "created_on"]
+
+
+def _plain(value):
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    return value
+
+
+class ColumnarArchive:
+    """Append-only archive under ``root``.
+
+    Attendance is partitioned by month (``attendance/month=2024-03/``) and students by the day
+    they were deleted (``students/deleted=2025-01-01/``). Each write adds one part file holding
+    the batch column by column, which compresses far better than row-wise JSON.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _write(self, table: str, partition: str, columns: list[str], rows: list[dict]):
+        directory = os.path.join(self.root, table, partition)
+        os.makedirs(directory, exist_ok=True)
+        data = {column: [_plain(row[column]) for row in rows] for column in columns}
+        name = f"part-{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}.json.gz"
+        tmp = os.path.join(directory, name + ".tmp")
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump({"columns": columns, "rows": len(rows), "data": data}, f, separators=(",", ":"))
+        # Readers never see a half-written part
+        os.replace(tmp, os.path.join(directory, name))
+
+    def write_attendance(self, rows: list[dict]) -> int:
+        by_month: dict[str, list[dict]] = {}
+        for row in rows:
+            by_month.setdefault(f"month={row['date']:%Y-%m}", []).append(row)
+        for partition, month_rows in by_month.items():
+            self._write("attendance", partition, ATTENDANCE_COLUMNS, month_rows)
+        return len(rows)
+
+    def write_students(self, rows: list[dict], deleted_on: date) -> int:
+        if rows:
+            self._write("students", f"deleted={deleted_on.isoformat()}", STUDENT_COLUMNS, rows)
+        return len(rows)
+
+    def _parts(self, table: str, keep_partition) -> Iterator[str]:
+        base = os.path.join(self.root, table)
+        if not os.path.isdir(base):
+            return
+        for partition in sorted(os.listdir(base)):
+            if not keep_partition(partition.split("=", 1)[-1]):
+                continue
+            directory = os.path.join(base, partition)
+            for name in sorted(os.listdir(directory)):
+                if name.endswith(".json.gz"):
+                    yield os.path.join(directory, name)
+
+    @staticmethod
+    def _read(path: str, roll: str | None) -> Iterable[dict]:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            part = json.load(f)
+        data = part["data"]
+        indexes = range(part["rows"])
+        if roll:
+            # Filter on the roll column alone before materializing any rows
+            indexes = [i for i, r in enumerate(data["roll"]) if r == roll]
+        return ({column: data[column][i] for column in part["columns"]} for i in indexes)
+
+    def scan_attendance(self, roll: str | None = None, dfrom: date | None = None, dto: date | None = None) -> Iterator[dict]:
+        low = f"{dfrom:%Y-%m}" if dfrom else ""
+        high = f"{dto:%Y-%m}" if dto else "9999-99"
+        low_day = dfrom.isoformat() if dfrom else ""
+        high_day = dto.isoformat() if dto else "9999-99-99"
+        seen = set()
+        for path in self._parts("attendance", lambda month: low <= month <= high):
+            for row in self._read(path, roll):
+                # A chunk whose delete was retried can have been archived twice
+                if row["id"] in seen or not low_day <= row["date"] <= high_day:
+                    continue
+                seen.add(row["id"])
+                yield row
+
+    def scan_students(self, roll: str | None = None, dfrom: date | None = None, dto: date | None = None) -> Iterator[dict]:
+        low = dfrom.isoformat() if dfrom else ""
+        high = dto.isoformat() if dto else "9999-99-99"
+        for path in self._parts("students", lambda day: low <= day <= high):
+            deleted_on = os.path.basename(os.path.dirname(path)).split("=", 1)[-1]
+            for row in self._read(path, roll):
+                yield {**row, "deleted_on": deleted_on}
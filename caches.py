@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe LRU mapping whose entries also expire ``ttl_seconds`` after being set."""
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self.maxsize = maxsize
+        self.ttl = ttl_seconds
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class RollIndex:
+    """Exact in-memory set of student rolls, so unknown rolls can be rejected without a query.
+
+    Misses fall back to the database (another worker may have just created the student) and
+    rolls the database also rejects are remembered in a short negative cache. The whole set
+    is reloaded every ``refresh_seconds`` to pick up deletions made by other workers.
+    """
+
+    def __init__(self, loader, refresh_seconds: float, negative_size: int, negative_ttl: float):
+        self._loader = loader
+        self.refresh_seconds = refresh_seconds
+        self._rolls: set[str] = set()
+        self._unknown = TTLCache(negative_size, negative_ttl)
+        self._loaded_at: float | None = None
+        self._lock = threading.Lock()
+        self._reloading = threading.Lock()
+
+    def load(self):
+        if not self._reloading.acquire(blocking=False):
+            return
+        try:
+            rolls = set(self._loader())
+            with self._lock:
+                self._rolls = rolls
+                self._loaded_at = time.monotonic()
+        finally:
+            self._reloading.release()
+
+    def _refresh_if_stale(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_seconds:
+            self.load()
+
+    def add(self, roll: str):
+        with self._lock:
+            self._rolls.add(roll)
+        self._unknown.discard(roll)
+
+    def discard(self, roll: str):
+        with self._lock:
+            self._rolls.discard(roll)
+
+    def known(self, rolls, fallback) -> set[str]:
+        """Subset of ``rolls`` that exist; ``fallback(missing)`` is queried only for cache misses."""
+        self._refresh_if_stale()
+        rolls = set(rolls)
+        with self._lock:
+            found = rolls & self._rolls
+        missing = {r for r in rolls - found if not self._unknown.get(r)}
+        if missing:
+            in_db = set(fallback(missing))
+            with self._lock:
+                self._rolls.update(in_db)
+            for roll in missing - in_db:
+                self._unknown.set(roll, True)
+            found |= in_db
+        return found
+
+    def exists(self, roll: str, fallback) -> bool:
+        return roll in self.known({roll}, fallback)
@@ -1,11 +1,30 @@
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
 from typing import Iterable
-from sqlalchemy import select, and_, or_, desc, asc
+from sqlalchemy import select, insert, update, bindparam, func, exists, literal, and_, or_, desc, asc, Date, Boolean, String
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 
-from models import Student, Attendance, Admin
+from models import Student, Attendance, Admin, TaskLock, TaskRun, Holiday, AttendanceMonthly
 from auth import get_password_hash
+from workdays import is_working_day
+
+
+# ===== Validity =====
+
+
+def parse_valid_until(issue_valid: str | None) -> date | None:
+    # issue_valid looks like "2021-25" or "2021-2025": valid until 31 Dec of the second year
+    try:
+        end_year = int(issue_valid.split("-")[1])
+    except (AttributeError, IndexError, ValueError):
+        return None
+    if end_year < 100:
+        end_year += 2000
+    try:
+        return date(end_year, 12, 31)
+    except ValueError:
+        return None
 
 
 # ===== Users =====
@@ -99,4 +118,406 @@ def list_attendance(
         stmt = stmt.order_by(Attendance.roll.asc(), Attendance.date.asc())
     else:
         stmt = stmt.order_by(Attendance.date.asc(), Attendance.roll.asc())
-    return db.execute(stmt).scalars().all()
\ No newline at end of file
+    return db.execute(stmt).scalars().all()
+
+def attendance_page(
+    db: Session,
+    roll: str,
+    dfrom: date,
+    dto: date,
+    status: str | None,
+    after: tuple[date, int] | None,
+    limit: int,
+) -> list[Attendance]:
+    # Keyset page of one roll's records, ordered by (date, id) and starting after ``after``
+    stmt = select(Attendance).where(Attendance.roll == roll, Attendance.date >= dfrom, Attendance.date <= dto)
+    if status:
+        stmt = stmt.where(Attendance.status.ilike(f"%{status}%"))
+    if after:
+        stmt = stmt.where(or_(Attendance.date > after[0], and_(Attendance.date == after[0], Attendance.id > after[1])))
+    return db.execute(stmt.order_by(Attendance.date, Attendance.id).limit(limit)).scalars().all()
+
+
+def stream_attendance_rows(db: Session, roll: str, dfrom: date, dto: date, status: str | None, batch_size: int):
+    # (roll, date, time, status) tuples in date order, fetched ``batch_size`` at a time from a server-side cursor
+    stmt = select(Attendance.roll, Attendance.date, Attendance.time, Attendance.status).where(
+        Attendance.roll == roll, Attendance.date >= dfrom, Attendance.date <= dto
+    )
+    if status:
+        stmt = stmt.where(Attendance.status.ilike(f"%{status}%"))
+    stmt = stmt.order_by(Attendance.date, Attendance.id).execution_options(yield_per=batch_size)
+    return db.execute(stmt)
+
+
+def attendance_exists(db: Session, roll: str, day: date) -> bool:
+    # Absent rows don't count: a Present mark still upgrades them
+    stmt = select(Attendance.id).where(Attendance.roll == roll, Attendance.date == day, Attendance.status == "Present")
+    return db.execute(stmt).first() is not None
+
+# ===== Bulk attendance =====
+
+ROLL_CHUNK_SIZE = 500
+
+
+def known_rolls(db: Session, rolls: Iterable[str]) -> set[str]:
+    rolls = list(rolls)
+    found: set[str] = set()
+    for i in range(0, len(rolls), ROLL_CHUNK_SIZE):
+        chunk = rolls[i:i + ROLL_CHUNK_SIZE]
+        found.update(db.execute(select(Student.roll).where(Student.roll.in_(chunk))).scalars())
+    return found
+
+
+def _dialect_insert(db: Session):
+    # Dialect insert() supporting ON CONFLICT, or None if the dialect has no such form
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert
+
+
+def upsert_present(db: Session, rows: list[dict]) -> int:
+    # Writes Present marks; one also replaces an Absent row already written for that day (a kiosk
+    # uploading after mark-absent ran) but never a Present one. Returns rows inserted or upgraded.
+    dialect_insert = _dialect_insert(db)
+    written = 0
+    if dialect_insert is None:
+        for row in rows:
+            try:
+                with db.begin_nested():
+                    db.execute(insert(Attendance).values(**row))
+                written += 1
+            except IntegrityError:
+                written += db.execute(
+                    update(Attendance)
+                    .where(Attendance.roll == row["roll"], Attendance.date == row["date"], Attendance.status == "Absent")
+                    .values(status="Present", time=row["time"], arrival_time=row["arrival_time"], late=row["late"])
+                ).rowcount
+        return written
+    stmt = dialect_insert(Attendance)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["roll", "date"],
+        set_={
+            "status": "Present",
+            "time": stmt.excluded.time,
+            "arrival_time": stmt.excluded.arrival_time,
+            "late": stmt.excluded.late,
+        },
+        where=Attendance.status == "Absent",
+    )
+    for i in range(0, len(rows), ROLL_CHUNK_SIZE):
+        written += db.execute(stmt.values(rows[i:i + ROLL_CHUNK_SIZE])).rowcount
+    return written
+
+
+def rolls_marked_on(db: Session, day: date) -> list[str]:
+    stmt = select(Attendance.roll).where(Attendance.date == day, Attendance.status == "Present")
+    return list(db.execute(stmt).scalars())
+
+
+def all_rolls(db: Session) -> list[str]:
+    return list(db.execute(select(Student.roll)).scalars())
+
+
+def student_pin_hash(db: Session, roll: str) -> str | None:
+    return db.execute(select(Student.pin).where(Student.roll == roll)).scalar_one_or_none()
+
+
+# ===== Reports =====
+
+
+def late_arrivals_by_branch(db: Session, dfrom: date, dto: date):
+    stmt = (
+        select(Student.branch, func.count(Attendance.id), func.count(func.distinct(Attendance.roll)))
+        .join(Student, Student.roll == Attendance.roll)
+        .where(Attendance.late == True, Attendance.date >= dfrom, Attendance.date <= dto)
+        .group_by(Student.branch)
+        .order_by(Student.branch)
+    )
+    return db.execute(stmt).all()
+
+
+# ===== Scheduled tasks =====
+
+
+def branches(db: Session) -> list[str]:
+    # Shard keys for the nightly tasks; students without a branch form the "" shard
+    return list(db.execute(select(func.coalesce(Student.branch, "")).distinct()).scalars())
+
+
+def branch_filter(branch: str | None):
+    if branch is None:
+        return True
+    return func.coalesce(Student.branch, "") == branch
+
+
+def mark_absent(db: Session, day: date, branch: str | None = None) -> int:
+    # INSERT INTO attendance SELECT ... FROM students WHERE NOT EXISTS (a record for that day)
+    already_marked = exists().where(Attendance.roll == Student.roll, Attendance.date == day)
+    on_holiday = exists().where(Holiday.date == day, or_(Holiday.branch == None, Holiday.branch == Student.branch))
+    absentees = select(
+        Student.roll,
+        literal(day, Date),
+        literal("", String),
+        literal(False, Boolean),
+        literal("Absent", String),
+    ).where(
+        ~already_marked,
+        ~on_holiday,
+        or_(Student.created_on == None, Student.created_on <= day),
+        branch_filter(branch),
+    )
+    columns = ["roll", "date", "time", "late", "status"]
+    dialect_insert = _dialect_insert(db)
+    if dialect_insert is None:
+        stmt = insert(Attendance).from_select(columns, absentees)
+    else:
+        # A kiosk mark landing mid-statement must not abort the whole insert
+        stmt = dialect_insert(Attendance).from_select(columns, absentees).on_conflict_do_nothing(index_elements=["roll", "date"])
+    return db.execute(stmt).rowcount
+
+
+# ===== Task locks and runs =====
+
+
+def acquire_task_lock(db: Session, name: str, owner: str, ttl: timedelta) -> bool:
+    # Taken if the row is new or the previous holder's lease has run out
+    now = datetime.utcnow()
+    try:
+        with db.begin_nested():
+            db.add(TaskLock(name=name, owner=owner, locked_until=now + ttl))
+        db.commit()
+        return True
+    except IntegrityError:
+        pass
+    taken = db.execute(
+        update(TaskLock)
+        .where(TaskLock.name == name, TaskLock.locked_until < now)
+        .values(owner=owner, locked_until=now + ttl)
+    ).rowcount
+    db.commit()
+    return taken == 1
+
+
+def release_task_lock(db: Session, name: str, owner: str, hold_until: datetime | None = None):
+    # ``hold_until`` keeps the lease past the end of the run, e.g. for the rest of a schedule firing
+    db.execute(
+        update(TaskLock)
+        .where(TaskLock.name == name, TaskLock.owner == owner)
+        .values(locked_until=max(hold_until or datetime.utcnow(), datetime.utcnow()))
+    )
+    db.commit()
+
+
+def task_runs(db: Session, task: str | None, limit: int) -> list[TaskRun]:
+    stmt = select(TaskRun).order_by(TaskRun.id.desc()).limit(limit)
+    if task:
+        stmt = stmt.where(TaskRun.task == task)
+    return db.execute(stmt).scalars().all()
+
+
+def marked_dates(db: Session, roll: str, dfrom: date, dto: date) -> list[date]:
+    stmt = select(Attendance.date).where(Attendance.roll == roll, Attendance.date >= dfrom, Attendance.date <= dto)
+    return list(db.execute(stmt).scalars())
+
+
+def present_dates(db: Session, roll: str, dfrom: date, dto: date) -> dict[date, bool]:
+    # Days the student was Present, mapped to whether they were late
+    stmt = select(Attendance.date, Attendance.late).where(
+        Attendance.roll == roll, Attendance.date >= dfrom, Attendance.date <= dto, Attendance.status == "Present"
+    )
+    return dict(db.execute(stmt).all())
+
+
+# ===== Calendar =====
+
+
+def holiday_dates(db: Session, dfrom: date, dto: date, branch: str | None) -> set[date]:
+    # College-wide holidays plus those of ``branch``
+    stmt = select(Holiday.date).where(
+        Holiday.date >= dfrom, Holiday.date <= dto, or_(Holiday.branch == None, Holiday.branch == branch)
+    )
+    return set(db.execute(stmt).scalars())
+
+
+def delete_absences_on(db: Session, day: date, branch: str | None) -> int:
+    # Absent rows already written for a day that has since been declared a holiday
+    stmt = Attendance.__table__.delete().where(Attendance.date == day, Attendance.status == "Absent")
+    if branch is not None:
+        stmt = stmt.where(Attendance.roll.in_(select(Student.roll).where(Student.branch == branch)))
+    return db.execute(stmt).rowcount
+
+
+def backfill_valid_until(db: Session, branch: str | None = None, chunk_size: int = 1000) -> int:
+    # Rows written before valid_until existed; walks by roll so unparseable values are visited once
+    updated = 0
+    last_roll = ""
+    while True:
+        rows = db.execute(
+            select(Student.roll, Student.issue_valid)
+            .where(Student.valid_until == None, Student.issue_valid != None, Student.roll > last_roll, branch_filter(branch))
+            .order_by(Student.roll)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            return updated
+        last_roll = rows[-1].roll
+        values = [{"b_roll": roll, "valid_until": parse_valid_until(issue_valid)} for roll, issue_valid in rows]
+        values = [v for v in values if v["valid_until"] is not None]
+        if values:
+            db.execute(
+                Student.__table__.update()
+                .where(Student.__table__.c.roll == bindparam("b_roll"))
+                .values(valid_until=bindparam("valid_until")),
+                values,
+            )
+            updated += len(values)
+        db.commit()
+
+
+def expired_students(db: Session, today: date, branch: str | None, limit: int):
+    # (roll, photo_public_id) rows
+    stmt = (
+        select(Student.roll, Student.photo_public_id)
+        .where(Student.valid_until < today, branch_filter(branch))
+        .order_by(Student.roll)
+        .limit(limit)
+    )
+    return db.execute(stmt).all()
+
+
+def delete_students(db: Session, rolls: list[str]) -> tuple[int, int]:
+    # Returns (students deleted, attendance rows deleted)
+    attendance = db.execute(Attendance.__table__.delete().where(Attendance.roll.in_(rolls))).rowcount
+    db.execute(AttendanceMonthly.__table__.delete().where(AttendanceMonthly.roll.in_(rolls)))
+    students = db.execute(Student.__table__.delete().where(Student.roll.in_(rolls))).rowcount
+    return students, attendance
+
+
+def count_attendance_before(db: Session, cutoff: date, after_id: int = 0) -> int:
+    stmt = select(func.count(Attendance.id)).where(Attendance.date < cutoff, Attendance.id > after_id)
+    return db.execute(stmt).scalar_one()
+
+
+def attendance_ids_before(db: Session, cutoff: date, after_id: int, limit: int) -> list[int]:
+    stmt = (
+        select(Attendance.id)
+        .where(Attendance.date < cutoff, Attendance.id > after_id)
+        .order_by(Attendance.id)
+        .limit(limit)
+    )
+    return list(db.execute(stmt).scalars())
+
+
+def delete_attendance_range(db: Session, cutoff: date, first_id: int, last_id: int) -> list[dict]:
+    # Returns the rows this transaction actually deleted; a concurrent run deleting the same
+    # range gets nothing back, so whatever is built from the result is never counted twice
+    table = Attendance.__table__
+    where = (Attendance.id >= first_id, Attendance.id <= last_id, Attendance.date < cutoff)
+    if db.get_bind().dialect.delete_returning:
+        return [dict(row) for row in db.execute(table.delete().where(*where).returning(*table.c)).mappings()]
+    rows = [dict(row) for row in db.execute(select(table).where(*where).with_for_update()).mappings()]
+    db.execute(table.delete().where(*where))
+    return rows
+
+
+# ===== Monthly rollups =====
+
+
+def working_day_checker(db: Session, rolls: Iterable[str], dfrom: date, dto: date):
+    # (roll, day) -> whether the day is a working day for the student's branch
+    rolls = list(rolls)
+    branches: dict[str, str | None] = {}
+    for i in range(0, len(rolls), ROLL_CHUNK_SIZE):
+        chunk = rolls[i:i + ROLL_CHUNK_SIZE]
+        branches.update(db.execute(select(Student.roll, Student.branch).where(Student.roll.in_(chunk))).all())
+    closed = set(db.execute(select(Holiday.date, Holiday.branch).where(Holiday.date >= dfrom, Holiday.date <= dto)).all())
+
+    def check(roll: str, day: date) -> bool:
+        return is_working_day(day) and (day, None) not in closed and (day, branches.get(roll)) not in closed
+    return check
+
+
+def rollup_attendance_rows(db: Session, rows: list[dict]):
+    # Adds rows deleted by delete_attendance_range to attendance_monthly. Present and late count
+    # only on working days, as /attendance/summary counts raw rows.
+    if not rows:
+        return
+    working = working_day_checker(
+        db, {row["roll"] for row in rows}, min(row["date"] for row in rows), max(row["date"] for row in rows)
+    )
+    counts: dict[tuple[str, date], dict] = {}
+    for row in rows:
+        c = counts.setdefault((row["roll"], row["date"].replace(day=1)), {"present": 0, "absent": 0, "late": 0})
+        if row["status"] == "Present" and working(row["roll"], row["date"]):
+            c["present"] += 1
+            if row["late"]:
+                c["late"] += 1
+        elif row["status"] == "Absent":
+            c["absent"] += 1
+    add_to_rollups(db, [{"roll": roll, "month": month, **c} for (roll, month), c in counts.items()])
+
+
+def add_to_rollups(db: Session, rows: list[dict]):
+    if not rows:
+        return
+    dialect_insert = _dialect_insert(db)
+    if dialect_insert is None:
+        for row in rows:
+            existing = db.get(AttendanceMonthly, (row["roll"], row["month"]))
+            if existing is None:
+                db.add(AttendanceMonthly(**row))
+            else:
+                existing.present += row["present"]
+                existing.absent += row["absent"]
+                existing.late += row["late"]
+        db.flush()
+        return
+    stmt = dialect_insert(AttendanceMonthly)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["roll", "month"],
+        set_={
+            "present": AttendanceMonthly.present + stmt.excluded.present,
+            "absent": AttendanceMonthly.absent + stmt.excluded.absent,
+            "late": AttendanceMonthly.late + stmt.excluded.late,
+        },
+    )
+    for i in range(0, len(rows), ROLL_CHUNK_SIZE):
+        db.execute(stmt.values(rows[i:i + ROLL_CHUNK_SIZE]))
+
+
+def rollups(db: Session, roll: str, dfrom: date, dto: date) -> list[AttendanceMonthly]:
+    stmt = (
+        select(AttendanceMonthly)
+        .where(AttendanceMonthly.roll == roll, AttendanceMonthly.month >= dfrom.replace(day=1), AttendanceMonthly.month <= dto)
+        .order_by(AttendanceMonthly.month)
+    )
+    return db.execute(stmt).scalars().all()
+
+
+def attendance_counts(db: Session, roll: str, dfrom: date, dto: date) -> list[tuple[date, str, bool]]:
+    stmt = select(Attendance.date, Attendance.status, Attendance.late).where(
+        Attendance.roll == roll, Attendance.date >= dfrom, Attendance.date <= dto
+    )
+    return db.execute(stmt).all()
+
+
+def photo_public_ids(db: Session) -> set[str]:
+    return set(db.execute(select(Student.photo_public_id).where(Student.photo_public_id != None)).scalars())
+
+
+# ===== Archive reads =====
+
+
+def attendance_rows_for(db: Session, rolls: list[str]) -> list[dict]:
+    stmt = select(Attendance.__table__).where(Attendance.roll.in_(rolls))
+    return [dict(row) for row in db.execute(stmt).mappings()]
+
+
+def student_rows(db: Session, rolls: list[str]) -> list[dict]:
+    stmt = select(Student.__table__).where(Student.roll.in_(rolls))
+    return [dict(row) for row in db.execute(stmt).mappings()]
@@ -0,0 +1,81 @@
+# Runs the attendance queries behind the endpoints and tasks, EXPLAINs each statement they emit
+# and exits non-zero if any of them reads an attendance table with a sequential scan.
+# Usage: DATABASE_URL=... python explain_check.py
+import sys
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+import crud
+from database import engine, SessionLocal
+from models import Base
+
+today = date.today()
+month_ago = today - timedelta(days=30)
+cutoff = today - timedelta(days=365)
+
+QUERIES = {
+    "GET /attendance": lambda db: crud.attendance_page(db, "CSE001", month_ago, today, None, None, 501),
+    "GET /attendance (next page)": lambda db: crud.attendance_page(db, "CSE001", month_ago, today, None, (month_ago, 1), 501),
+    "GET /attendance?format=ndjson": lambda db: list(crud.stream_attendance_rows(db, "CSE001", month_ago, today, None, 1000)),
+    "POST /attendance/mark (write-behind)": lambda db: crud.attendance_exists(db, "CSE001", today),
+    "GET /attendance (virtual absences)": lambda db: crud.marked_dates(db, "CSE001", month_ago, today),
+    "GET /attendance/summary": lambda db: crud.present_dates(db, "CSE001", month_ago, today),
+    "GET /attendance/monthly": lambda db: crud.attendance_counts(db, "CSE001", month_ago, today),
+    "GET /reports/late-arrivals": lambda db: crud.late_arrivals_by_branch(db, month_ago, today),
+    "POST /calendar/holidays": lambda db: crud.delete_absences_on(db, today, None),
+    "presence rebuild": lambda db: crud.rolls_marked_on(db, today),
+    "mark-absent": lambda db: crud.mark_absent(db, today),
+    "delete-expired-students (archive)": lambda db: crud.attendance_rows_for(db, ["CSE001"]),
+    "delete-expired-students": lambda db: crud.delete_students(db, ["CSE001"]),
+    "cleanup count": lambda db: crud.count_attendance_before(db, cutoff),
+    "cleanup chunk": lambda db: crud.attendance_ids_before(db, cutoff, 0, 1000),
+    "cleanup delete": lambda db: crud.delete_attendance_range(db, cutoff, 1, 1000),
+}
+
+
+def sequential_scans(conn, statement, parameters) -> list[str]:
+    if engine.dialect.name == "sqlite":
+        plan = [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+        return [line for line in plan if line.startswith("SCAN attendance")]
+    plan = [row[0] for row in conn.exec_driver_sql("EXPLAIN " + statement, parameters)]
+    return [line.strip() for line in plan if "Seq Scan on attendance" in line]
+
+
+def main() -> int:
+    Base.metadata.create_all(bind=engine)
+    failures = 0
+    with engine.connect() as conn:
+        if engine.dialect.name == "postgresql":
+            # Small test tables are cheaper to scan; this asks whether an index could be used at all
+            conn.exec_driver_sql("SET enable_seqscan = off")
+            conn.commit()
+        for name, run in QUERIES.items():
+            statements = []
+
+            def capture(conn, cursor, statement, parameters, context, executemany):
+                if "attendance" in statement:
+                    statements.append((statement, parameters))
+
+            transaction = conn.begin()
+            try:
+                event.listen(engine, "before_cursor_execute", capture)
+                try:
+                    with SessionLocal(bind=conn) as db:
+                        run(db)
+                finally:
+                    event.remove(engine, "before_cursor_execute", capture)
+                for statement, parameters in statements:
+                    scans = sequential_scans(conn, statement, parameters)
+                    print(f"{'FAIL' if scans else 'ok  '} {name}")
+                    for line in scans:
+                        print(f"       {line}")
+                    failures += bool(scans)
+            finally:
+                # Queries that write are run for real; nothing they do is kept
+                transaction.rollback()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+# jobs.py - runs maintenance tasks off the request path and records them in task_runs
+import json
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import crud
+from database import SessionLocal
+from models import TaskRun
+
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _update_run(run_id: int, **values):
+    db = SessionLocal()
+    try:
+        db.query(TaskRun).filter(TaskRun.id == run_id).update(values)
+        db.commit()
+    finally:
+        db.close()
+
+
+def create_run(name: str, trigger: str, status: str = "queued") -> int:
+    db = SessionLocal()
+    try:
+        run = TaskRun(task=name, trigger=trigger, status=status, started_at=datetime.utcnow(), progress=0, rows=0)
+        db.add(run)
+        db.commit()
+        return run.id
+    finally:
+        db.close()
+
+
+def execute_run(run_id: int, func):
+    """Run ``func(progress)`` for an existing task_runs row, recording progress, result and duration."""
+    _update_run(run_id, status="running", started_at=datetime.utcnow())
+    started = time.perf_counter()
+
+    def progress(done: int, total: int, rows: int):
+        _update_run(run_id, progress=done / total if total else 1.0, rows=rows)
+
+    values = {}
+    result = None
+    try:
+        result = func(progress)
+        values.update(status="succeeded", progress=1.0, result=json.dumps(result, default=str))
+        # Sharded tasks report a failed shard in its result instead of raising
+        shards = result.get("shards", []) if isinstance(result, dict) else []
+        failed = [shard for shard in shards if shard.get("error")]
+        if failed:
+            values.update(
+                status="failed" if len(failed) == len(shards) else "partial",
+                error="; ".join(f"{shard['shard'] or '(no branch)'}: {shard['error']}" for shard in failed),
+            )
+    except Exception as e:
+        values.update(status="failed", error=str(e))
+    values.update(finished_at=datetime.utcnow(), duration_ms=round((time.perf_counter() - started) * 1000, 1))
+    _update_run(run_id, **values)
+    return result
+
+
+def fail_stale_runs(older_than: timedelta) -> int:
+    """Mark runs still queued or running after ``older_than`` as failed; their worker is gone.
+
+    A run that is in fact still going overwrites this with its real outcome when it finishes.
+    """
+    db = SessionLocal()
+    try:
+        count = (
+            db.query(TaskRun)
+            .filter(TaskRun.status.in_(["queued", "running"]), TaskRun.started_at < datetime.utcnow() - older_than)
+            .update({"status": "failed", "error": "Interrupted: the worker stopped before the run finished", "finished_at": datetime.utcnow()})
+        )
+        db.commit()
+        return count
+    finally:
+        db.close()
+
+
+def run_recorded(name: str, trigger: str, func):
+    return execute_run(create_run(name, trigger, status="running"), func)
+
+
+def acquire_lock(name: str, ttl: timedelta) -> bool:
+    db = SessionLocal()
+    try:
+        return crud.acquire_task_lock(db, name, OWNER, ttl)
+    finally:
+        db.close()
+
+
+def release_lock(name: str, hold_until: datetime | None = None):
+    db = SessionLocal()
+    try:
+        crud.release_task_lock(db, name, OWNER, hold_until)
+    finally:
+        db.close()
+
+
+class JobRunner:
+    """Dedicated thread pool for /tasks jobs; callers get a task_runs id to poll.
+
+    Jobs take the same task_locks lease as scheduled runs, so an API run never overlaps
+    a scheduled one, or another API run, of the same task.
+    """
+
+    def __init__(self, max_workers: int, lock_ttl_seconds: int = 3600):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="task-job")
+        self.lock_ttl = timedelta(seconds=lock_ttl_seconds)
+
+    def submit(self, name: str, func) -> int:
+        run_id = create_run(name, "api")
+        self._pool.submit(self._execute, run_id, name, func)
+        return run_id
+
+    def _execute(self, run_id: int, name: str, func):
+        if not acquire_lock(name, self.lock_ttl):
+            _update_run(run_id, status="failed", error=f"Skipped: the {name} lock is held by another run", finished_at=datetime.utcnow())
+            return
+        try:
+            execute_run(run_id, func)
+        finally:
+            release_lock(name)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -1,15 +1,42 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, Query, Header,Request
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, Query, Header,Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from fastapi.staticfiles import StaticFiles
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta, date
 import os
-import cloudinary.uploader
+import base64
+import hashlib
+import csv
+import heapq
+import io
+import itertools
+import json
+import zlib
+import cloudinary
 from typing import Optional
 
 from database import Base, engine, SessionLocal
-from models import Student, Attendance, Admin
-from schemas import StudentCreate, StudentResponse, AttendanceOut, AdminLogin, MarkAttendance
+from models import Student, Attendance, AttendanceMonthly, Admin, TaskRun, Holiday, ATTENDANCE_PARTITIONED
+from schemas import StudentCreate, StudentResponse, AttendanceOut, AdminLogin, MarkAttendance, MarkAttendanceWithPin, HolidayCreate, HolidayOut
 from auth import create_access_token, verify_password, get_password_hash
+import crud
+import tasks
+from scheduler import MaintenanceScheduler
+from jobs import JobRunner, fail_stale_runs
+from workdays import working_days, is_working_day
+import partitions
+from photo_storage import CloudinaryPhotoStorage, LocalPhotoStorage
+from archive import ColumnarArchive
+from write_buffer import AttendanceWriteBuffer, BufferFull
+from caches import TTLCache, RollIndex
+from presence import PresenceSet
+from pin_pool import PinVerifier, PoolSaturated
 from dotenv import load_dotenv
 
 # ----------------- Load environment variables -----------------
@@ -17,6 +44,95 @@ load_dotenv()
 
 MARK_ABSENT_API_KEY = os.getenv("MARK_ABSENT_API_KEY")
 
+# Write-behind mode: /attendance/mark queues marks and a background thread commits them in batches
+ATTENDANCE_WRITE_BEHIND = os.getenv("ATTENDANCE_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+ATTENDANCE_FLUSH_INTERVAL_MS = int(os.getenv("ATTENDANCE_FLUSH_INTERVAL_MS", "200"))
+ATTENDANCE_FLUSH_BATCH_SIZE = int(os.getenv("ATTENDANCE_FLUSH_BATCH_SIZE", "500"))
+ATTENDANCE_BUFFER_SIZE = int(os.getenv("ATTENDANCE_BUFFER_SIZE", "10000"))
+ATTENDANCE_BUFFER_TIMEOUT_MS = int(os.getenv("ATTENDANCE_BUFFER_TIMEOUT_MS", "1000"))
+
+# Idempotency-Key replay cache for /attendance/mark (per worker process)
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "600"))
+
+# Shared "marked today" set, so repeat scans are answered without SQL
+PRESENCE_ENABLED = os.getenv("PRESENCE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Named after the database, so instances on one host that use different databases never share a set
+PRESENCE_SHM_NAME = os.getenv(
+    "PRESENCE_SHM_NAME",
+    "attendance_presence_" + hashlib.sha256(os.getenv("DATABASE_URL", "").encode()).hexdigest()[:16],
+)
+PRESENCE_CAPACITY = int(os.getenv("PRESENCE_CAPACITY", "262144"))
+
+# In-memory roll index in front of Student lookups
+ROLL_INDEX_REFRESH_SECONDS = int(os.getenv("ROLL_INDEX_REFRESH_SECONDS", "300"))
+ROLL_INDEX_NEGATIVE_TTL_SECONDS = int(os.getenv("ROLL_INDEX_NEGATIVE_TTL_SECONDS", "60"))
+
+# bcrypt PIN checks for /attendance/mark-with-pin run in a process pool
+PIN_POOL_SIZE = int(os.getenv("PIN_POOL_SIZE", "2"))
+PIN_POOL_MAX_QUEUE = int(os.getenv("PIN_POOL_MAX_QUEUE", "64"))
+# A roll is refused PIN marks for PIN_LOCKOUT_SECONDS after this many wrong PINs in a row
+PIN_MAX_FAILURES = int(os.getenv("PIN_MAX_FAILURES", "5"))
+PIN_LOCKOUT_SECONDS = int(os.getenv("PIN_LOCKOUT_SECONDS", "900"))
+PIN_LOCKOUT_CACHE_SIZE = int(os.getenv("PIN_LOCKOUT_CACHE_SIZE", "10000"))
+
+# Arrivals after this time (HH:MM) are flagged late when the mark is written
+ATTENDANCE_LATE_CUTOFF = datetime.strptime(os.getenv("ATTENDANCE_LATE_CUTOFF", "09:00"), "%H:%M").time()
+
+# Virtual absence mode: only Present rows are stored and Absent entries are derived when read
+ATTENDANCE_VIRTUAL_ABSENCE = os.getenv("ATTENDANCE_VIRTUAL_ABSENCE", "false").lower() in ("1", "true", "yes")
+
+# GET /attendance pages; the cursor for the next page is returned in the X-Next-Cursor header
+ATTENDANCE_PAGE_SIZE = int(os.getenv("ATTENDANCE_PAGE_SIZE", "500"))
+ATTENDANCE_MAX_PAGE_SIZE = int(os.getenv("ATTENDANCE_MAX_PAGE_SIZE", "2000"))
+# Rows fetched from the server-side cursor, and written out, per chunk with ?format=ndjson|csv
+ATTENDANCE_STREAM_BATCH = int(os.getenv("ATTENDANCE_STREAM_BATCH", "1000"))
+
+# Longest from_date..to_date range /tasks/mark-absent accepts in one call
+MARK_ABSENT_MAX_DAYS = int(os.getenv("MARK_ABSENT_MAX_DAYS", "366"))
+
+# Nightly tasks run one shard per branch on this many pooled connections (always 1 on SQLite)
+TASK_SHARD_WORKERS = int(os.getenv("TASK_SHARD_WORKERS", "4"))
+
+# In-process cron for the /tasks jobs; a DB lock lets only one worker run each job.
+# An empty expression disables that job.
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "false").lower() in ("1", "true", "yes")
+SCHEDULER_TIMEZONE = os.getenv("SCHEDULER_TIMEZONE") or None
+MARK_ABSENT_CRON = os.getenv("MARK_ABSENT_CRON", "55 23 * * *")
+DELETE_EXPIRED_STUDENTS_CRON = os.getenv("DELETE_EXPIRED_STUDENTS_CRON", "30 0 * * *")
+CLEANUP_OLD_ATTENDANCE_CRON = os.getenv("CLEANUP_OLD_ATTENDANCE_CRON", "0 2 * * *")
+TASK_LOCK_TTL_SECONDS = int(os.getenv("TASK_LOCK_TTL_SECONDS", "3600"))
+
+# Expired students are deleted this many at a time, one commit per chunk
+EXPIRED_PURGE_CHUNK_SIZE = int(os.getenv("EXPIRED_PURGE_CHUNK_SIZE", "500"))
+
+# cleanup-old-attendance deletes by primary-key ranges of this size, pausing between ranges
+CLEANUP_CHUNK_SIZE = int(os.getenv("CLEANUP_CHUNK_SIZE", "5000"))
+CLEANUP_PAUSE_MS = int(os.getenv("CLEANUP_PAUSE_MS", "50"))
+
+# Monthly attendance partitions (Postgres with ATTENDANCE_PARTITIONED) are created this far ahead;
+# going back they start at the retention cutoff, the oldest month cleanup keeps
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+PARTITION_MAINTENANCE_CRON = os.getenv("PARTITION_MAINTENANCE_CRON", "0 1 * * *")
+
+# Orphaned photo sweep; assets younger than the grace period may belong to a student being created
+PHOTO_RECONCILE_CRON = os.getenv("PHOTO_RECONCILE_CRON", "0 3 * * 0")
+PHOTO_RECONCILE_GRACE_MINUTES = int(os.getenv("PHOTO_RECONCILE_GRACE_MINUTES", "60"))
+
+# Rows removed by delete-expired-students and cleanup-old-attendance are archived here first; empty disables
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "")
+ARCHIVE_QUERY_MAX_ROWS = int(os.getenv("ARCHIVE_QUERY_MAX_ROWS", "10000"))
+
+# Threads running /tasks jobs queued over HTTP
+TASK_JOB_WORKERS = int(os.getenv("TASK_JOB_WORKERS", "2"))
+# Runs left queued/running this long are marked failed at startup (a restart killed them)
+TASK_RUN_STALE_MINUTES = int(os.getenv("TASK_RUN_STALE_MINUTES", "60"))
+
+# Offline kiosk uploads (/attendance/upload)
+ATTENDANCE_UPLOAD_BATCH_SIZE = int(os.getenv("ATTENDANCE_UPLOAD_BATCH_SIZE", "500"))
+ATTENDANCE_UPLOAD_MAX_AGE_DAYS = int(os.getenv("ATTENDANCE_UPLOAD_MAX_AGE_DAYS", "7"))
+ATTENDANCE_UPLOAD_MAX_LINE_BYTES = 4096
+
 # ----------------- Configure Cloudinary -----------------
 cloudinary.config(
     cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
@@ -28,8 +144,85 @@ cloudinary.config(
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Where student photos live: "cloudinary", or "local" (a directory stand-in, for development and tests)
+PHOTO_STORAGE = os.getenv("PHOTO_STORAGE", "cloudinary")
+PHOTO_LOCAL_DIR = os.getenv("PHOTO_LOCAL_DIR", UPLOAD_DIR)
+PHOTO_FOLDER = "students"
+photo_storage = LocalPhotoStorage(PHOTO_LOCAL_DIR) if PHOTO_STORAGE == "local" else CloudinaryPhotoStorage()
+
+# ----------------- Caches -----------------
+idempotency_cache = TTLCache(IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_TTL_SECONDS)
+
+presence = None
+if PRESENCE_ENABLED:
+    try:
+        presence = PresenceSet(PRESENCE_SHM_NAME, PRESENCE_CAPACITY)
+    except OSError as e:
+        print(f"Shared presence set disabled: {e}")
+
+
+def _load_rolls():
+    db = SessionLocal()
+    try:
+        return crud.all_rolls(db)
+    finally:
+        db.close()
+
+
+roll_index = RollIndex(_load_rolls, ROLL_INDEX_REFRESH_SECONDS, 10000, ROLL_INDEX_NEGATIVE_TTL_SECONDS)
+
+
+def rebuild_presence():
+    today = date.today()
+    db = SessionLocal()
+    try:
+        presence.add_many(crud.rolls_marked_on(db, today), today)
+    finally:
+        db.close()
+
+
+# ----------------- Background workers -----------------
+attendance_buffer = AttendanceWriteBuffer(
+    flush_interval_ms=ATTENDANCE_FLUSH_INTERVAL_MS,
+    max_batch=ATTENDANCE_FLUSH_BATCH_SIZE,
+    max_pending=ATTENDANCE_BUFFER_SIZE,
+    put_timeout_ms=ATTENDANCE_BUFFER_TIMEOUT_MS,
+    # A mark that was never written must not keep answering "already marked"
+    on_drop=lambda row: presence and presence.discard(row["roll"], row["date"]),
+) if ATTENDANCE_WRITE_BEHIND else None
+
+pin_verifier = PinVerifier(PIN_POOL_SIZE, PIN_POOL_MAX_QUEUE)
+# roll -> consecutive wrong PINs; the entry expires PIN_LOCKOUT_SECONDS after the last failure
+pin_failures = TTLCache(PIN_LOCKOUT_CACHE_SIZE, PIN_LOCKOUT_SECONDS)
+archive = ColumnarArchive(ARCHIVE_DIR) if ARCHIVE_DIR else None
+job_runner = JobRunner(TASK_JOB_WORKERS, TASK_LOCK_TTL_SECONDS)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if ATTENDANCE_PARTITIONED:
+        await run_in_threadpool(_ensure_partitions)
+    await run_in_threadpool(roll_index.load)
+    await run_in_threadpool(fail_stale_runs, timedelta(minutes=TASK_RUN_STALE_MINUTES))
+    if presence:
+        await run_in_threadpool(rebuild_presence)
+    if attendance_buffer:
+        attendance_buffer.start()
+    if maintenance_scheduler:
+        maintenance_scheduler.start()
+    yield
+    if maintenance_scheduler:
+        maintenance_scheduler.shutdown()
+    if attendance_buffer:
+        attendance_buffer.stop()
+    pin_verifier.shutdown()
+    job_runner.shutdown()
+    if presence:
+        presence.close(unlink=True)
+
+
 # ----------------- Initialize FastAPI -----------------
-app = FastAPI(title="College Admin Backend")
+app = FastAPI(title="College Admin Backend", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -37,8 +230,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+if PHOTO_STORAGE == "local":
+    # Serves the URLs LocalPhotoStorage hands out
+    os.makedirs(PHOTO_LOCAL_DIR, exist_ok=True)
+    app.mount("/photos", StaticFiles(directory=PHOTO_LOCAL_DIR), name="photos")
+
 # ----------------- Dependency -----------------
 def get_db():
     db = SessionLocal()
@@ -99,9 +298,7 @@ async def create_student(
     if db_student:
         raise HTTPException(status_code=400, detail="Roll number already exists")
     if photo:
-        upload_result = cloudinary.uploader.upload(photo.file, folder="students")
-        photo_url = upload_result.get("secure_url")
-        public_id = upload_result.get("public_id")
+        photo_url, public_id = photo_storage.upload(photo.file, PHOTO_FOLDER, photo.filename)
     else:
         photo_url = None
         public_id = None
@@ -111,6 +308,7 @@ async def create_student(
         branch=branch,
         dob=dob,
         issue_valid=issue_valid,
+        valid_until=crud.parse_valid_until(issue_valid),
         pin=get_password_hash(pin),
         photo=photo_url,
         photo_public_id=public_id
@@ -118,6 +316,7 @@ async def create_student(
     db.add(new_student)
     db.commit()
     db.refresh(new_student)
+    roll_index.add(roll)
     return new_student
 
 
@@ -150,6 +349,8 @@ def list_students(
 # ---------------------------------get student detail--------------------
 @app.get("/students/{roll}", response_model=StudentResponse)
 def get_student(roll: str, db: Session = Depends(get_db)):
+    if not roll_index.exists(roll.upper(), lambda rolls: crud.known_rolls(db, rolls)):
+        raise HTTPException(status_code=404, detail="Not found")
     s = db.query(Student).filter(Student.roll == roll.upper()).first()
     if not s:
         raise HTTPException(status_code=404, detail="Not found")
@@ -170,19 +371,12 @@ def update_student(
     if not s:
         raise HTTPException(status_code=404, detail="Student not found")
 
-    # ---------------- Upload photo to Cloudinary ----------------
+    # ---------------- Upload photo ----------------
+    # The old photo is deleted only once the new one is saved
+    old_public_id = None
     if photo:
-        # Delete old photo if exists
-        if s.photo_public_id:
-            try:
-                cloudinary.uploader.destroy(s.photo_public_id)
-            except Exception as e:
-                print(f"Failed to delete old image: {e}")
-
-        # Upload new photo
-        upload_result = cloudinary.uploader.upload(photo.file, folder="students")
-        s.photo = upload_result.get("secure_url")
-        s.photo_public_id = upload_result.get("public_id")
+        old_public_id = s.photo_public_id
+        s.photo, s.photo_public_id = photo_storage.upload(photo.file, PHOTO_FOLDER, photo.filename)
 
     # ---------------- Update other fields ----------------
     if name is not None and name.strip() != "":
@@ -193,6 +387,7 @@ def update_student(
 
     if issue_valid is not None and issue_valid.strip() != "":
         s.issue_valid = issue_valid
+        s.valid_until = crud.parse_valid_until(issue_valid)
 
     if branch is not None and branch.strip() != "":
         s.branch = branch
@@ -204,6 +399,8 @@ def update_student(
 
     db.commit()
     db.refresh(s)
+    if old_public_id:
+        _delete_photo(old_public_id)
     return s
 #---------------------delete student--------------------------
 @app.delete("/students/{roll}")
@@ -212,83 +409,553 @@ def delete_student(roll: str, db: Session = Depends(get_db)):
     if not s:
         raise HTTPException(status_code=404, detail="Student not found")
 
-    if s.photo_public_id:
-        try:
-            cloudinary.uploader.destroy(s.photo_public_id)
-        except Exception as e:
-            print(f"Failed to delete image from Cloudinary: {e}")
-
+    public_id = s.photo_public_id
     db.query(Attendance).filter(Attendance.roll == roll.upper()).delete(synchronize_session=False)
+    db.query(AttendanceMonthly).filter(AttendanceMonthly.roll == roll.upper()).delete(synchronize_session=False)
     db.delete(s)
     db.commit()
+    roll_index.discard(roll.upper())
+    if presence:
+        presence.discard(roll.upper(), date.today())
+    if public_id:
+        _delete_photo(public_id)
     return {"ok": True}
 
 
+def _delete_photo(public_id: str):
+    # Best effort: a photo that could not be deleted is unreferenced now, so reconcile-photos sweeps it later
+    try:
+        if not photo_storage.delete(public_id):
+            print(f"Photo {public_id} was not deleted; left for reconcile-photos")
+    except Exception as e:
+        print(f"Failed to delete photo {public_id}, left for reconcile-photos: {e}")
+
+
 # ----------------- Attendance APIs -----------------
+ARRIVAL_TIME_FORMATS = ("%H:%M:%S", "%H:%M", "%I:%M:%S %p", "%I:%M %p", "%I:%M%p")
+
+
+def parse_arrival_time(value: str):
+    for fmt in ARRIVAL_TIME_FORMATS:
+        try:
+            return datetime.strptime(value.strip().upper(), fmt).time()
+        except ValueError:
+            pass
+    return None
+
+
+def _present_row(roll: str, day: date, time: str) -> dict:
+    arrival = parse_arrival_time(time)
+    return {
+        "roll": roll,
+        "date": day,
+        "time": time,
+        "arrival_time": arrival,
+        "late": arrival is not None and arrival > ATTENDANCE_LATE_CUTOFF,
+        "status": "Present",
+    }
+
+
 @app.post("/attendance/mark")
-def mark_attendance(attendance_data: MarkAttendance, db: Session = Depends(get_db)):
-    student = db.query(Student).filter(Student.roll == attendance_data.roll).first()
-    if not student:
-        raise HTTPException(status_code=404, detail="Student not found")
+def mark_attendance(
+    attendance_data: MarkAttendance,
+    idempotency_key: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    if not idempotency_key:
+        return _mark_attendance(attendance_data, db)
+
+    # Retries with the same key are answered from the cache; only client errors and successes are replayed
+    fingerprint = (attendance_data.roll, attendance_data.date, attendance_data.time)
+    cached = idempotency_cache.get(idempotency_key)
+    if cached is not None:
+        cached_fingerprint, status_code, body = cached
+        if cached_fingerprint != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key reused with a different request")
+        if status_code != 200:
+            raise HTTPException(status_code=status_code, detail=body)
+        return body
+    try:
+        result = _mark_attendance(attendance_data, db)
+    except HTTPException as e:
+        if e.status_code < 500:
+            idempotency_cache.set(idempotency_key, (fingerprint, e.status_code, e.detail))
+        raise
+    idempotency_cache.set(idempotency_key, (fingerprint, 200, result))
+    return result
+
+
+def _mark_attendance(attendance_data: MarkAttendance, db: Session):
     today = date.today()
+    if presence and attendance_data.date == today and presence.contains(attendance_data.roll, today):
+        return {"message": "Attendance already marked"}
+    if not roll_index.exists(attendance_data.roll, lambda rolls: crud.known_rolls(db, rolls)):
+        raise HTTPException(status_code=404, detail="Student not found")
     if attendance_data.date != today:
         raise HTTPException(status_code=400, detail="Invalid date")
-    record = db.query(Attendance).filter(Attendance.roll == attendance_data.roll, Attendance.date == today).first()
-    if record:
+    row = _present_row(attendance_data.roll, today, attendance_data.time)
+    if attendance_buffer:
+        result = _buffer_mark(row, db)
+    else:
+        try:
+            inserted = crud.upsert_present(db, [row])
+            db.commit()
+        except IntegrityError:
+            # Foreign key failure: the student was deleted by another worker since the index was loaded
+            db.rollback()
+            roll_index.discard(attendance_data.roll)
+            raise HTTPException(status_code=404, detail="Student not found")
+        result = {"message": "Attendance marked as Present" if inserted else "Attendance already marked"}
+    if presence:
+        presence.add(attendance_data.roll, today)
+    return result
+
+
+@app.post("/attendance/mark-with-pin")
+async def mark_attendance_with_pin(attendance_data: MarkAttendanceWithPin, db: Session = Depends(get_db)):
+    failures = pin_failures.get(attendance_data.roll, 0)
+    if failures >= PIN_MAX_FAILURES:
+        raise HTTPException(status_code=429, detail="Too many wrong PINs, retry later")
+    pin_hash = await run_in_threadpool(crud.student_pin_hash, db, attendance_data.roll)
+    if not pin_hash:
+        raise HTTPException(status_code=404, detail="Student not found")
+    try:
+        valid = await pin_verifier.verify(attendance_data.pin, pin_hash)
+    except PoolSaturated:
+        raise HTTPException(status_code=503, detail="PIN verification is busy, retry shortly")
+    if not valid:
+        pin_failures.set(attendance_data.roll, failures + 1)
+        raise HTTPException(status_code=401, detail="Invalid PIN")
+    pin_failures.discard(attendance_data.roll)
+    return await run_in_threadpool(_mark_attendance, attendance_data, db)
+
+
+def _buffer_mark(row: dict, db: Session):
+    if attendance_buffer.is_pending(row["roll"], row["date"]):
+        return {"message": "Attendance already marked"}
+    if crud.attendance_exists(db, row["roll"], row["date"]):
+        return {"message": "Attendance already marked"}
+    try:
+        queued = attendance_buffer.submit(row)
+    except BufferFull:
+        raise HTTPException(status_code=503, detail="Attendance queue is full, retry shortly")
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if not queued:
         return {"message": "Attendance already marked"}
-    new_record = Attendance(roll=attendance_data.roll, date=today,time=attendance_data.time, status="Present")
-    db.add(new_record)
-    db.commit()
-    db.refresh(new_record)
     return {"message": "Attendance marked as Present"}
 
+
+def _mark_records(db: Session, records: list[MarkAttendance], latest_date: date, earliest_date: date):
+    known = roll_index.known(
+        {r.roll for r in records if earliest_date <= r.date <= latest_date},
+        lambda rolls: crud.known_rolls(db, rolls),
+    )
+    rows = []
+    seen = set()
+    already_marked = 0
+    rejected = []
+    for r in records:
+        if not earliest_date <= r.date <= latest_date:
+            rejected.append({"roll": r.roll, "detail": "Invalid date"})
+        elif r.roll not in known:
+            rejected.append({"roll": r.roll, "detail": "Student not found"})
+        elif (r.roll, r.date) in seen:
+            already_marked += 1
+        else:
+            seen.add((r.roll, r.date))
+            rows.append(_present_row(r.roll, r.date, r.time))
+    try:
+        marked = crud.upsert_present(db, rows)
+    except IntegrityError:
+        # Foreign key failure: a student was deleted since the roll index was loaded; recheck and retry once
+        db.rollback()
+        existing = crud.known_rolls(db, {row["roll"] for row in rows})
+        for row in [row for row in rows if row["roll"] not in existing]:
+            roll_index.discard(row["roll"])
+            rejected.append({"roll": row["roll"], "detail": "Student not found"})
+        rows = [row for row in rows if row["roll"] in existing]
+        marked = crud.upsert_present(db, rows)
+    already_marked += len(rows) - marked
+    db.commit()
+    if presence:
+        today = date.today()
+        presence.add_many((row["roll"] for row in rows if row["date"] == today), today)
+    return {"marked": marked, "already_marked": already_marked, "rejected": rejected}
+
+
+@app.post("/attendance/mark-batch")
+def mark_attendance_batch(records: list[MarkAttendance], db: Session = Depends(get_db)):
+    today = date.today()
+    return _mark_records(db, records, today, today)
+
+
+@app.post("/attendance/upload")
+async def upload_attendance(request: Request, db: Session = Depends(get_db)):
+    # NDJSON body of {roll, date, time} lines, optionally gzip-compressed, read and written batch by batch
+    today = date.today()
+    earliest = today - timedelta(days=ATTENDANCE_UPLOAD_MAX_AGE_DAYS)
+    gzipped = "gzip" in request.headers.get("content-encoding", "").lower()
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzipped else None
+    batches = []
+    records = []
+    rejected = 0
+    line_no = 0
+    pending = b""
+
+    async def flush():
+        nonlocal records, rejected
+        result = await run_in_threadpool(_mark_records, db, records, today, earliest)
+        batches.append({
+            "batch": len(batches) + 1,
+            "accepted": result["marked"],
+            "duplicate": result["already_marked"],
+            "rejected": rejected + len(result["rejected"]),
+        })
+        records = []
+        rejected = 0
+
+    def parse(line: bytes):
+        nonlocal rejected, line_no
+        line_no += 1
+        if not line.strip():
+            return
+        try:
+            records.append(MarkAttendance.model_validate_json(line))
+        except ValueError:
+            rejected += 1
+
+    async def body():
+        async for chunk in request.stream():
+            if not decompressor:
+                yield chunk
+                continue
+            # Inflated a bounded piece at a time, so a tiny gzip chunk cannot expand all at once
+            while chunk:
+                try:
+                    yield decompressor.decompress(chunk, ATTENDANCE_UPLOAD_MAX_LINE_BYTES)
+                except zlib.error:
+                    raise HTTPException(status_code=400, detail="Invalid gzip body")
+                chunk = decompressor.unconsumed_tail
+        if decompressor:
+            yield decompressor.flush()
+
+    async for chunk in body():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        if len(pending) > ATTENDANCE_UPLOAD_MAX_LINE_BYTES:
+            raise HTTPException(status_code=413, detail=f"Line {line_no + len(lines) + 1} is too long")
+        for line in lines:
+            parse(line)
+            if len(records) + rejected >= ATTENDANCE_UPLOAD_BATCH_SIZE:
+                await flush()
+    parse(pending)
+    if records or rejected:
+        await flush()
+
+    return {
+        "accepted": sum(b["accepted"] for b in batches),
+        "duplicate": sum(b["duplicate"] for b in batches),
+        "rejected": sum(b["rejected"] for b in batches),
+        "batches": batches,
+    }
+
+
 @app.get("/attendance", response_model=list[AttendanceOut])
 def list_attendance(
+    response: Response,
     roll: str = Query(...),
     status: Optional[str] = Query(None),
     from_date: str = Query(None),
     to_date: str = Query(None),
-    orderBy: str = Query(None),
+    orderBy: str = Query(None),  # Kept for old clients; one roll's records always come in date order
+    cursor: str = Query(None),
+    limit: int = Query(ATTENDANCE_PAGE_SIZE, ge=1),
+    output_format: str = Query(None, alias="format", pattern="^(ndjson|csv)$"),
     db: Session = Depends(get_db)
 ):
     today = date.today()
     default_start = date(today.year - 1, today.month, 1)
     from_dt = datetime.strptime(from_date, "%Y-%m-%d").date() if from_date else default_start
     to_dt = datetime.strptime(to_date, "%Y-%m-%d").date() if to_date else today
-    q = db.query(Attendance).filter(Attendance.roll == roll.upper(), Attendance.date >= from_dt, Attendance.date <= to_dt)
-    if status:
-        q = q.filter(Attendance.status.ilike(f"%{status}%"))
-    if orderBy == "roll":
-        q = q.order_by(Attendance.roll)
-    elif orderBy == "date":
-        q = q.order_by(Attendance.date)
-    return q.all()
+    limit = min(limit, ATTENDANCE_MAX_PAGE_SIZE)
+    after = decode_cursor(cursor) if cursor else None
+    if not roll_index.exists(roll.upper(), lambda rolls: crud.known_rolls(db, rolls)):
+        return [] if not output_format else StreamingResponse(iter([]), media_type=STREAM_MEDIA_TYPES[output_format])
+    if output_format:
+        # The whole range, unpaged; the request's session is closed before the body is sent
+        rows = stream_attendance(roll.upper(), status, from_dt, to_dt, output_format)
+        return StreamingResponse(rows, media_type=STREAM_MEDIA_TYPES[output_format])
+    # One row past the page tells whether there is a next page
+    records = crud.attendance_page(db, roll.upper(), from_dt, to_dt, status, after, limit + 1)
+    if ATTENDANCE_VIRTUAL_ABSENCE and (not status or status.lower() in "absent"):
+        # Only absences that can land on this page: after the cursor, up to the first row of the next page
+        start = after[0] + timedelta(days=1) if after else from_dt
+        end = records[limit].date if len(records) > limit else to_dt
+        records = sorted([*records, *virtual_absences(db, roll.upper(), start, end)], key=page_key)[:limit + 1]
+    if len(records) > limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(*page_key(records[limit - 1]))
+    return records[:limit]
+
+
+def page_key(record) -> tuple[date, int]:
+    # Virtual absences have no id; they fall on days without any stored record, so 0 cannot collide
+    return record.date, getattr(record, "id", 0)
+
+
+def encode_cursor(day: date, record_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{day.isoformat()}|{record_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[date, int]:
+    try:
+        day, record_id = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split("|")
+        return date.fromisoformat(day), int(record_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def virtual_absences(db: Session, roll: str, from_dt: date, to_dt: date) -> list[AttendanceOut]:
+    return [AttendanceOut(roll=roll, date=day, time="", status="Absent") for day in absent_days(db, roll, from_dt, to_dt)]
+
+
+def absent_days(db: Session, roll: str, from_dt: date, to_dt: date) -> list[date]:
+    # Working days without any record count as Absent, from the day the student was added up to yesterday
+    student = db.query(Student.created_on, Student.branch).filter(Student.roll == roll).first()
+    if not student:
+        return []
+    start = max(from_dt, student.created_on or from_dt)
+    end = min(to_dt, date.today() - timedelta(days=1))
+    if start > end:
+        return []
+    marked = set(crud.marked_dates(db, roll, start, end))
+    return [day for day in working_days(start, end, crud.holiday_dates(db, start, end, student.branch)) if day not in marked]
+
+
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def stream_attendance(roll: str, status: str | None, from_dt: date, to_dt: date, output_format: str):
+    # Plain tuples straight from the cursor to text chunks; no ORM or Pydantic objects per row
+    db = SessionLocal()
+    try:
+        absences = []
+        if ATTENDANCE_VIRTUAL_ABSENCE and (not status or status.lower() in "absent"):
+            absences = ((roll, day, "", "Absent") for day in absent_days(db, roll, from_dt, to_dt))
+        rows = crud.stream_attendance_rows(db, roll, from_dt, to_dt, status, ATTENDANCE_STREAM_BATCH)
+        rows = heapq.merge(rows, absences, key=lambda row: row[1])
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if output_format == "csv" else None
+        if writer:
+            writer.writerow(["roll", "date", "time", "status"])
+        for n, (row_roll, day, row_time, row_status) in enumerate(rows, 1):
+            if writer:
+                writer.writerow([row_roll, day.isoformat(), row_time, row_status])
+            else:
+                buffer.write(json.dumps({"roll": row_roll, "date": day.isoformat(), "time": row_time, "status": row_status}) + "\n")
+            if n % ATTENDANCE_STREAM_BATCH == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        db.close()
+
+
+@app.get("/attendance/summary")
+def attendance_summary(
+    roll: str = Query(...),
+    from_date: str = Query(None),
+    to_date: str = Query(None),
+    db: Session = Depends(get_db)
+):
+    # Percentage over working days from the calendar, not over however many rows happen to exist.
+    # Months already compacted by cleanup-old-attendance are read from attendance_monthly.
+    today = date.today()
+    roll = roll.upper()
+    student = db.query(Student.created_on, Student.branch).filter(Student.roll == roll).first()
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found")
+    from_dt = datetime.strptime(from_date, "%Y-%m-%d").date() if from_date else date(today.year - 1, today.month, 1)
+    to_dt = datetime.strptime(to_date, "%Y-%m-%d").date() if to_date else today
+    start = max(from_dt, student.created_on or from_dt)
+    end = min(to_dt, today)
+    present_days = crud.present_dates(db, roll, start, end) if start <= end else {}
+    if end == today and today not in present_days:
+        # Like absent_days: today only counts once the student has been marked
+        end = today - timedelta(days=1)
+    if start > end:
+        total, present, late = 0, 0, 0
+    else:
+        # Only Present rows on working days; a mark on a Sunday or a holiday is not attendance owed
+        days = set(working_days(start, end, crud.holiday_dates(db, start, end, student.branch)))
+        present, late = 0, 0
+        for rollup in crud.rollups(db, roll, start, end):
+            month_end = partitions.add_months(rollup.month, 1) - timedelta(days=1)
+            if start <= rollup.month and month_end <= end:
+                present += rollup.present
+                late += rollup.late
+            else:
+                # A compacted month only partly in range cannot be split by day; leave its days out entirely
+                days = {day for day in days if not rollup.month <= day <= month_end}
+        total = len(days)
+        present += sum(1 for day in present_days if day in days)
+        late += sum(1 for day, was_late in present_days.items() if was_late and day in days)
+    return {
+        "roll": roll,
+        "from_date": start,
+        "to_date": end,
+        "working_days": total,
+        "present": present,
+        "absent": total - present,
+        "late": late,
+        "percentage": round(present / total * 100, 2) if total else None,
+    }
+
+
+@app.get("/attendance/monthly")
+def attendance_monthly(
+    roll: str = Query(...),
+    from_date: str = Query(None),
+    to_date: str = Query(None),
+    db: Session = Depends(get_db)
+):
+    # Per-month counts: compacted months from attendance_monthly plus recent months from raw rows
+    today = date.today()
+    roll = roll.upper()
+    from_dt = datetime.strptime(from_date, "%Y-%m-%d").date() if from_date else date(today.year - 5, 1, 1)
+    to_dt = datetime.strptime(to_date, "%Y-%m-%d").date() if to_date else today
+    months: dict[date, dict] = {}
+    for rollup in crud.rollups(db, roll, from_dt, to_dt):
+        months[rollup.month] = {"present": rollup.present, "absent": rollup.absent, "late": rollup.late}
+    # Present and late count only on working days, as in the rollups and /attendance/summary
+    working = crud.working_day_checker(db, [roll], from_dt, to_dt)
+    for day, status, late in crud.attendance_counts(db, roll, from_dt, to_dt):
+        counts = months.setdefault(day.replace(day=1), {"present": 0, "absent": 0, "late": 0})
+        if status == "Present" and working(roll, day):
+            counts["present"] += 1
+            if late:
+                counts["late"] += 1
+        elif status == "Absent":
+            counts["absent"] += 1
+    if ATTENDANCE_VIRTUAL_ABSENCE:
+        # No Absent rows are stored, raw or rolled up: a month's absences are its working days without a Present
+        for month, working in monthly_working_days(db, roll, from_dt, min(to_dt, today)).items():
+            counts = months.setdefault(month, {"present": 0, "absent": 0, "late": 0})
+            counts["absent"] = max(working - counts["present"], 0)
+    return [{"month": month.strftime("%Y-%m"), **counts} for month, counts in sorted(months.items())]
+
+
+def monthly_working_days(db: Session, roll: str, from_dt: date, to_dt: date) -> dict[date, int]:
+    # Working days per month since the student was added, counted the same way as /attendance/summary
+    student = db.query(Student.created_on, Student.branch).filter(Student.roll == roll).first()
+    if not student:
+        return {}
+    start = max(from_dt, student.created_on or from_dt)
+    if start > to_dt:
+        return {}
+    months: dict[date, int] = {}
+    for day in working_days(start, to_dt, crud.holiday_dates(db, start, to_dt, student.branch)):
+        months[day.replace(day=1)] = months.get(day.replace(day=1), 0) + 1
+    return months
+
+
+# ----------------- Calendar APIs -----------------
+@app.post("/calendar/holidays", response_model=HolidayOut)
+def create_holiday(data: HolidayCreate, db: Session = Depends(get_db)):
+    # Checked here as well for databases created before uq_holidays_date_college existed
+    if data.branch is None and crud.holiday_dates(db, data.date, data.date, None):
+        raise HTTPException(status_code=400, detail="Holiday already exists")
+    holiday = Holiday(date=data.date, branch=data.branch, name=data.name)
+    db.add(holiday)
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Holiday already exists")
+    # Absences already marked for that day no longer apply
+    crud.delete_absences_on(db, data.date, data.branch)
+    db.commit()
+    db.refresh(holiday)
+    return holiday
+
+
+@app.get("/calendar/holidays", response_model=list[HolidayOut])
+def list_holidays(
+    from_date: str = Query(None),
+    to_date: str = Query(None),
+    branch: str = Query(None),
+    db: Session = Depends(get_db)
+):
+    q = db.query(Holiday)
+    if from_date:
+        q = q.filter(Holiday.date >= datetime.strptime(from_date, "%Y-%m-%d").date())
+    if to_date:
+        q = q.filter(Holiday.date <= datetime.strptime(to_date, "%Y-%m-%d").date())
+    if branch:
+        q = q.filter((Holiday.branch == branch) | (Holiday.branch == None))
+    return q.order_by(Holiday.date).all()
+
+
+@app.delete("/calendar/holidays/{holiday_id}")
+def delete_holiday(holiday_id: int, db: Session = Depends(get_db)):
+    holiday = db.get(Holiday, holiday_id)
+    if not holiday:
+        raise HTTPException(status_code=404, detail="Holiday not found")
+    db.delete(holiday)
+    db.commit()
+    return {"ok": True}
+
+
+# ----------------- Reports -----------------
+@app.get("/reports/late-arrivals")
+def late_arrivals_report(month: str = Query(None), db: Session = Depends(get_db)):
+    # month as YYYY-MM, defaults to the current month
+    start = datetime.strptime(month, "%Y-%m").date() if month else date.today().replace(day=1)
+    end = (start.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    rows = crud.late_arrivals_by_branch(db, start, end)
+    return [{"branch": branch, "late_count": late_count, "students": students} for branch, late_count, students in rows]
 
 
 # ----------------- Secure Scheduled Tasks APIs -----------------
-@app.post("/tasks/mark-absent")
-async def api_mark_absent_students(
+@app.post("/tasks/mark-absent", status_code=202)
+def api_mark_absent_students(
     request: Request,
+    from_date: str = Query(None),
+    to_date: str = Query(None),
     mark_absent_api_key: str = Header(...),
     db: Session = Depends(get_db)
 ):
 
     verify_api_key(mark_absent_api_key)
 
+    # Without dates only today is marked; a range backfills days the scheduler missed
     today = date.today()
-    students = db.query(Student).all()
-    for student in students:
-        record = db.query(Attendance).filter(Attendance.roll == student.roll, Attendance.date == today).first()
-        if not record:
-            absent_record = Attendance(roll=student.roll, date=today, status="Absent")
-            db.add(absent_record)
-    db.commit()
+    to_dt = datetime.strptime(to_date, "%Y-%m-%d").date() if to_date else today
+    from_dt = datetime.strptime(from_date, "%Y-%m-%d").date() if from_date else to_dt
+    if to_dt > today:
+        raise HTTPException(status_code=400, detail="to_date cannot be in the future")
+    if from_dt > to_dt:
+        raise HTTPException(status_code=400, detail="from_date must not be after to_date")
+    if (to_dt - from_dt).days >= MARK_ABSENT_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"At most {MARK_ABSENT_MAX_DAYS} days can be marked at once")
+
+    days = [from_dt + timedelta(days=i) for i in range((to_dt - from_dt).days + 1)]
+    job_id = job_runner.submit("mark-absent", lambda progress: _mark_absent(days, progress))
+
+    return {"message": "Mark absent job queued", "job_id": job_id}
 
-    return {"message": "Absent students marked"}
 
+def _mark_absent(days: list[date], progress=None):
+    if ATTENDANCE_VIRTUAL_ABSENCE:
+        return {"inserted": 0, "days": [], "shards": [], "virtual": True}
+    working = [day for day in days if is_working_day(day)]
+    return tasks.mark_absent(working, TASK_SHARD_WORKERS, progress)
 
-@app.post("/tasks/delete-expired-students")
-async def api_delete_expired_students(
+
+@app.post("/tasks/delete-expired-students", status_code=202)
+def api_delete_expired_students(
         request: Request,
         mark_absent_api_key: str = Header(None),
         db: Session = Depends(get_db)
@@ -296,50 +963,190 @@ async def api_delete_expired_students(
     # Verify API key
     verify_api_key(mark_absent_api_key)
 
-    today = datetime.today()
-    deleted_count = 0
+    job_id = job_runner.submit("delete-expired-students", _delete_expired_students)
 
-    # Fetch students with valid issue_valid
-    students = db.query(Student).filter(Student.issue_valid != None).all()
+    return {"message": "Delete expired students job queued", "job_id": job_id}
 
-    for student in students:
-        try:
-            end_year_part = student.issue_valid.split("-")[1]
-            end_year = int(end_year_part)
-            if end_year < 100:
-                end_year += 2000
 
-            expire_date = datetime(end_year, 12, 31)
+def _delete_expired_students(progress=None):
+    result = tasks.delete_expired_students(date.today(), TASK_SHARD_WORKERS, EXPIRED_PURGE_CHUNK_SIZE, progress, archive)
+    for roll in result.pop("deleted_rolls"):
+        roll_index.discard(roll)
+    photo_ids = result.pop("photo_ids")
+    try:
+        result["photos_deleted"] = len(photo_storage.delete_many(photo_ids))
+    except Exception as e:
+        # Left for the reconcile-photos sweep
+        print(f"Failed to delete photos of expired students: {e}")
+        result["photos_deleted"] = 0
+    return result
 
-            if today > expire_date:
-                # Delete student's attendance records
-                db.query(Attendance).filter(Attendance.roll == student.roll).delete()
-                # Delete student record
-                db.delete(student)
-                deleted_count += 1
 
-        except Exception as e:
-            print(f"Error deleting student {student.roll}: {e}")
+@app.post("/tasks/cleanup-old-attendance", status_code=202)
+def api_cleanup_old_attendance(
+    request: Request,
+    chunk_size: int = Query(None, ge=1, le=100000),
+    pause_ms: int = Query(None, ge=0, le=60000),
+    after_id: int = Query(0, ge=0),
+    dry_run: bool = Query(False),
+    mark_absent_api_key: str = Header(None),
+    db: Session = Depends(get_db)
+):
+    verify_api_key(mark_absent_api_key)
 
-    db.commit()
+    if dry_run:
+        count = crud.count_attendance_before(db, _attendance_cutoff(), after_id)
+        return {"message": f"{count} old attendance records would be deleted", "count": count}
+
+    job_id = job_runner.submit(
+        "cleanup-old-attendance",
+        lambda progress: _cleanup_old_attendance(progress, chunk_size, pause_ms, after_id),
+    )
+
+    return {"message": "Cleanup old attendance job queued", "job_id": job_id}
 
-    return {"message": f"{deleted_count} expired students deleted"}
 
+def _attendance_cutoff() -> date:
+    return date.today() - timedelta(days=365)
 
-@app.post("/tasks/cleanup-old-attendance")
-async def api_cleanup_old_attendance(
+
+def _cleanup_old_attendance(progress=None, chunk_size=None, pause_ms=None, after_id=0):
+    return tasks.cleanup_old_attendance(
+        _attendance_cutoff(),
+        chunk_size or CLEANUP_CHUNK_SIZE,
+        CLEANUP_PAUSE_MS if pause_ms is None else pause_ms,
+        after_id,
+        progress,
+        archive,
+    )
+
+
+@app.post("/tasks/reconcile-photos", status_code=202)
+def api_reconcile_photos(
     request: Request,
+    dry_run: bool = Query(False),
     mark_absent_api_key: str = Header(None),
     db: Session = Depends(get_db)
 ):
     verify_api_key(mark_absent_api_key)
 
-    today = datetime.today()
-    cutoff_date = today - timedelta(days=365)
-    deleted_count = db.query(Attendance).filter(Attendance.date < cutoff_date.date()).delete()
-    db.commit()
+    job_id = job_runner.submit("reconcile-photos", lambda progress: _reconcile_photos(progress, dry_run))
+
+    return {"message": "Reconcile photos job queued", "job_id": job_id}
+
+
+def _reconcile_photos(progress=None, dry_run: bool = False):
+    return tasks.reconcile_photos(
+        photo_storage,
+        PHOTO_FOLDER + "/",
+        timedelta(minutes=PHOTO_RECONCILE_GRACE_MINUTES),
+        dry_run=dry_run,
+        progress=progress,
+    )
+
+
+def _task_run_out(run, with_result: bool = False):
+    out = {
+        "id": run.id,
+        "task": run.task,
+        "trigger": run.trigger,
+        "status": run.status,
+        "progress": run.progress,
+        "rows": run.rows,
+        "started_at": run.started_at,
+        "finished_at": run.finished_at,
+        "elapsed_ms": run.duration_ms,
+        "error": run.error,
+    }
+    if run.status == "running":
+        out["elapsed_ms"] = round((datetime.utcnow() - run.started_at).total_seconds() * 1000, 1)
+    if with_result:
+        out["result"] = json.loads(run.result) if run.result else None
+    return out
+
+
+@app.get("/tasks/jobs/{job_id}")
+def get_task_job(job_id: int, mark_absent_api_key: str = Header(None), db: Session = Depends(get_db)):
+    verify_api_key(mark_absent_api_key)
+    run = db.get(TaskRun, job_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _task_run_out(run, with_result=True)
+
+
+@app.get("/tasks/runs")
+def list_task_runs(
+    task: str = Query(None),
+    limit: int = 50,
+    mark_absent_api_key: str = Header(None),
+    db: Session = Depends(get_db)
+):
+    verify_api_key(mark_absent_api_key)
+    return [_task_run_out(run) for run in crud.task_runs(db, task, min(limit, 500))]
+
+
+# ----------------- Archive APIs -----------------
+@app.get("/archive/attendance")
+def query_archived_attendance(
+    roll: str = Query(None),
+    from_date: str = Query(None),
+    to_date: str = Query(None),
+    limit: int = Query(1000, ge=1),
+    mark_absent_api_key: str = Header(None),
+):
+    verify_api_key(mark_absent_api_key)
+    if not archive:
+        raise HTTPException(status_code=404, detail="Archive is not enabled")
+    from_dt = datetime.strptime(from_date, "%Y-%m-%d").date() if from_date else None
+    to_dt = datetime.strptime(to_date, "%Y-%m-%d").date() if to_date else None
+    rows = archive.scan_attendance(roll.upper() if roll else None, from_dt, to_dt)
+    return list(itertools.islice(rows, min(limit, ARCHIVE_QUERY_MAX_ROWS)))
+
+
+@app.get("/archive/students")
+def query_archived_students(
+    roll: str = Query(None),
+    from_date: str = Query(None),
+    to_date: str = Query(None),
+    limit: int = Query(1000, ge=1),
+    mark_absent_api_key: str = Header(None),
+):
+    # from_date / to_date filter on the day the student was deleted
+    verify_api_key(mark_absent_api_key)
+    if not archive:
+        raise HTTPException(status_code=404, detail="Archive is not enabled")
+    from_dt = datetime.strptime(from_date, "%Y-%m-%d").date() if from_date else None
+    to_dt = datetime.strptime(to_date, "%Y-%m-%d").date() if to_date else None
+    rows = archive.scan_students(roll.upper() if roll else None, from_dt, to_dt)
+    return list(itertools.islice(rows, min(limit, ARCHIVE_QUERY_MAX_ROWS)))
+
+
+# ----------------- Scheduler -----------------
+def _scheduled_mark_absent(progress=None):
+    return _mark_absent([date.today()], progress)
+
+
+def _ensure_partitions(progress=None):
+    return {"created": partitions.ensure_partitions(engine, _attendance_cutoff(), PARTITION_MONTHS_AHEAD)}
 
-    return {"message": f"{deleted_count} old attendance records deleted"}
+
+maintenance_scheduler = MaintenanceScheduler(
+    {
+        "mark-absent": (MARK_ABSENT_CRON, _scheduled_mark_absent),
+        "delete-expired-students": (DELETE_EXPIRED_STUDENTS_CRON, _delete_expired_students),
+        "cleanup-old-attendance": (CLEANUP_OLD_ATTENDANCE_CRON, _cleanup_old_attendance),
+        "reconcile-photos": (PHOTO_RECONCILE_CRON, _reconcile_photos),
+        "ensure-partitions": (PARTITION_MAINTENANCE_CRON if ATTENDANCE_PARTITIONED else "", _ensure_partitions),
+    },
+    timezone=SCHEDULER_TIMEZONE,
+    lock_ttl_seconds=TASK_LOCK_TTL_SECONDS,
+) if SCHEDULER_ENABLED else None
+
+
+# ----------------- Metrics -----------------
+@app.get("/metrics/pin-verifier")
+def pin_verifier_metrics():
+    return pin_verifier.metrics()
 
 
 # ----------------- Root -----------------
@@ -349,4 +1156,27 @@ def read_root():
 
 
 # ----------------- Database Setup -----------------
-Base.metadata.create_all(bind=engine)
\ No newline at end of file
+# Columns added since the first release. create_all never alters a table that already exists,
+# so they are added here; existing rows get NULL or the given default.
+ADDED_COLUMNS = [
+    ("attendance", "arrival_time", "TIME"),
+    ("attendance", "late", "BOOLEAN NOT NULL DEFAULT false"),
+    ("students", "valid_until", "DATE"),  # Filled in by backfill_valid_until on the next expiry run
+    ("students", "created_on", "DATE"),  # NULL for existing students: absences are counted from from_date
+]
+
+
+def upgrade_schema():
+    # Idempotent, and safe to run from every worker at once
+    columns = {table: {c["name"] for c in inspect(engine).get_columns(table)} for table, _, _ in ADDED_COLUMNS}
+    if_not_exists = "IF NOT EXISTS " if engine.dialect.name == "postgresql" else ""
+    with engine.begin() as conn:
+        for table, column, ddl in ADDED_COLUMNS:
+            if column not in columns[table]:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {if_not_exists}{column} {ddl}"))
+        for index in [*Attendance.__table__.indexes, *Student.__table__.indexes]:
+            conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+Base.metadata.create_all(bind=engine)
+upgrade_schema()
\ No newline at end of file
@@ -1,7 +1,15 @@
 # models.py
-from sqlalchemy import Column, String, Integer, Date, Boolean, ForeignKey, CHAR,Text
+import os
+from datetime import date
+from sqlalchemy import Column, String, Integer, Date, DateTime, Time, Boolean, Float, ForeignKey, CHAR,Text, UniqueConstraint, Index, text
 from sqlalchemy.orm import relationship
-from database import Base
+from database import Base, engine
+
+# Monthly range partitions on attendance.date (Postgres only); retention then drops whole months
+ATTENDANCE_PARTITIONED = (
+    engine.dialect.name == "postgresql"
+    and os.getenv("ATTENDANCE_PARTITIONED", "false").lower() in ("1", "true", "yes")
+)
 
 
 class Admin(Base):
@@ -22,9 +30,11 @@ class Student(Base):
     branch = Column(String(50))
     dob = Column(Date)
     issue_valid = Column(String(20))
+    valid_until = Column(Date, index=True)  # 31 Dec of issue_valid's end year, set on every write
     pin = Column(Text, nullable=False)  # Store hashed pin here
     photo = Column(String(255))  # URL of the image
     photo_public_id = Column(String(255))  # Cloudinary public_id
+    created_on = Column(Date, default=date.today)  # No absences are recorded before this day
 
     # Correct relationship property name
     attendances = relationship("Attendance", back_populates="student")
@@ -32,14 +42,86 @@ class Student(Base):
 
 class Attendance(Base):
     __tablename__ = "attendance"
+    __table_args__ = (
+        # One record per student per day; lets marking use INSERT ... ON CONFLICT DO NOTHING.
+        # Its (roll, date) index also serves every per-student date-range query.
+        UniqueConstraint("roll", "date", name="uq_attendance_roll_date"),
+        # Late-arrival reports filter on late = true over a date range
+        Index("ix_attendance_late_date", "late", "date"),
+        # Tasks filter on date alone; rows arrive in date order, so a BRIN index stays tiny on Postgres
+        Index("ix_attendance_date", "date", postgresql_using="brin"),
+        # Absences written for a day that later became a holiday are deleted by date
+        Index(
+            "ix_attendance_absent_date",
+            "date",
+            postgresql_where=text("status = 'Absent'"),
+            sqlite_where=text("status = 'Absent'"),
+        ),
+        {"postgresql_partition_by": "RANGE (date)"} if ATTENDANCE_PARTITIONED else {},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
-    roll = Column(String(20), ForeignKey("students.roll"), index=True)  # Added index
-    date = Column(Date, nullable=False)
-    time = Column(String(20), nullable=False)
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    roll = Column(String(20), ForeignKey("students.roll"))  # Indexed through uq_attendance_roll_date
+    # A partitioned table's primary key has to include the partition column
+    date = Column(Date, nullable=False, primary_key=ATTENDANCE_PARTITIONED)
+    time = Column(String(20), nullable=False)  # As sent by the kiosk
+    arrival_time = Column(Time)  # Parsed from time at write time, NULL if unparseable
+    late = Column(Boolean, nullable=False, default=False)
     status = Column(String(10), nullable=False)
 
     student = relationship("Student", back_populates="attendances")
 
 
+class TaskLock(Base):
+    __tablename__ = "task_locks"
+
+    name = Column(String(50), primary_key=True)
+    owner = Column(String(100), nullable=False)  # host:pid of the worker holding it
+    locked_until = Column(DateTime, nullable=False)
+
+
+class TaskRun(Base):
+    __tablename__ = "task_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    task = Column(String(50), nullable=False, index=True)
+    trigger = Column(String(20), nullable=False)  # "schedule" or "api"
+    status = Column(String(20), nullable=False)  # queued / running / succeeded / partial / failed
+    progress = Column(Float)  # Fraction of shards done, 0..1
+    rows = Column(Integer)  # Rows inserted or deleted so far
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime)
+    duration_ms = Column(Float)
+    result = Column(Text)  # JSON
+    error = Column(Text)
+
 
+class Holiday(Base):
+    __tablename__ = "holidays"
+    __table_args__ = (
+        UniqueConstraint("date", "branch", name="uq_holidays_date_branch"),
+        # NULLs never compare equal, so the constraint above lets college-wide holidays repeat
+        Index(
+            "uq_holidays_date_college",
+            "date",
+            unique=True,
+            postgresql_where=text("branch IS NULL"),
+            sqlite_where=text("branch IS NULL"),
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    date = Column(Date, nullable=False, index=True)
+    branch = Column(String(50))  # NULL means the whole college is closed
+    name = Column(String(100))
+
+
+class AttendanceMonthly(Base):
+    # Per-student monthly counts of attendance rows that cleanup-old-attendance has removed
+    __tablename__ = "attendance_monthly"
+
+    roll = Column(String(20), primary_key=True)
+    month = Column(Date, primary_key=True)  # First day of the month
+    present = Column(Integer, nullable=False, default=0)
+    absent = Column(Integer, nullable=False, default=0)
+    late = Column(Integer, nullable=False, default=0)
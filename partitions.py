@@ -0,0 +1,106 @@
+# partitions.py - monthly range partitions of attendance on Postgres
+import re
+from datetime import date
+
+from sqlalchemy import text
+
+from workdays import WORKING_WEEKDAYS
+
+PARTITION_RE = re.compile(r"^attendance_y(\d{4})m(\d{2})$")
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, n: int) -> date:
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"attendance_y{month.year}m{month.month:02d}"
+
+
+def ensure_partitions(engine, oldest: date, months_ahead: int) -> list[str]:
+    """Create any missing monthly partitions from the month of ``oldest`` up to ``months_ahead``
+    months past the current one, plus a default partition.
+
+    ``oldest`` is the retention cutoff, so no month cleanup would drop again is ever created.
+    Months that already have rows in the default partition cannot be attached and are skipped.
+    """
+    current = month_start(date.today())
+    first = month_start(oldest)
+    months_back = (current.year - first.year) * 12 + current.month - first.month
+    created = []
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE IF NOT EXISTS attendance_default PARTITION OF attendance DEFAULT"))
+    except Exception as e:
+        # Another worker starting at the same moment may have won the race
+        print(f"Could not create default partition: {e}")
+    with engine.connect() as conn:
+        existing = {name for name, _ in list_partitions(conn)}
+    for n in range(-months_back, months_ahead + 1):
+        month = add_months(current, n)
+        name = partition_name(month)
+        if name in existing:
+            continue
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF attendance "
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+                ))
+            created.append(name)
+        except Exception as e:
+            print(f"Could not create partition {name}: {e}")
+    return created
+
+
+def list_partitions(conn) -> list[tuple[str, date]]:
+    # (name, first day of month) of every monthly partition, oldest first
+    rows = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = 'attendance'"
+    )).scalars()
+    partitions = []
+    for name in rows:
+        match = PARTITION_RE.match(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+def expired_partitions(conn, cutoff: date) -> list[tuple[str, date]]:
+    # Partitions whose whole month lies before ``cutoff``
+    return [(name, month) for name, month in list_partitions(conn) if add_months(month, 1) <= cutoff]
+
+
+def rollup_partition(conn, name: str):
+    # Same counts as crud.rollup_attendance_rows, computed in one GROUP BY over the partition
+    isodows = ", ".join(str(day + 1) for day in sorted(WORKING_WEEKDAYS)) or "NULL"
+    working = (
+        f"EXTRACT(ISODOW FROM a.date) IN ({isodows}) AND NOT EXISTS ("
+        "SELECT 1 FROM holidays h WHERE h.date = a.date AND (h.branch IS NULL OR h.branch = s.branch))"
+    )
+    conn.execute(text(
+        "INSERT INTO attendance_monthly (roll, month, present, absent, late) "
+        "SELECT a.roll, date_trunc('month', a.date)::date, "
+        f"count(*) FILTER (WHERE a.status = 'Present' AND {working}), "
+        "count(*) FILTER (WHERE a.status = 'Absent'), "
+        f"count(*) FILTER (WHERE a.status = 'Present' AND a.late AND {working}) "
+        f"FROM {name} a LEFT JOIN students s ON s.roll = a.roll "
+        "GROUP BY a.roll, date_trunc('month', a.date) "
+        "ON CONFLICT (roll, month) DO UPDATE SET "
+        "present = attendance_monthly.present + excluded.present, "
+        "absent = attendance_monthly.absent + excluded.absent, "
+        "late = attendance_monthly.late + excluded.late"
+    ))
+
+
+def drop_partition(conn, name: str):
+    conn.execute(text(f"ALTER TABLE attendance DETACH PARTITION {name}"))
+    conn.execute(text(f"DROP TABLE {name}"))
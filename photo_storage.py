@@ -0,0 +1,87 @@
+# photo_storage.py - upload, listing and deletion of student photos
+import os
+import shutil
+import uuid
+from datetime import datetime, timezone
+from typing import BinaryIO, Iterator
+
+import cloudinary.api
+import cloudinary.uploader
+
+# Cloudinary accepts at most 100 public_ids per delete_resources call
+DELETE_BATCH_SIZE = 100
+
+
+class CloudinaryPhotoStorage:
+    def upload(self, file: BinaryIO, folder: str, filename: str | None = None) -> tuple[str, str]:
+        # (url, public_id) of the stored image
+        result = cloudinary.uploader.upload(file, folder=folder)
+        return result.get("secure_url"), result.get("public_id")
+
+    def delete(self, public_id: str) -> bool:
+        return cloudinary.uploader.destroy(public_id).get("result") == "ok"
+
+    def list_assets(self, prefix: str) -> Iterator[tuple[str, datetime]]:
+        # (public_id, created_at) of every uploaded image under ``prefix``
+        cursor = None
+        while True:
+            options = {"type": "upload", "prefix": prefix, "max_results": 500}
+            if cursor:
+                options["next_cursor"] = cursor
+            page = cloudinary.api.resources(**options)
+            for resource in page.get("resources", []):
+                created = datetime.fromisoformat(resource["created_at"].replace("Z", "+00:00"))
+                yield resource["public_id"], created
+            cursor = page.get("next_cursor")
+            if not cursor:
+                return
+
+    def delete_many(self, public_ids: list[str]) -> list[str]:
+        deleted = []
+        for i in range(0, len(public_ids), DELETE_BATCH_SIZE):
+            result = cloudinary.api.delete_resources(public_ids[i:i + DELETE_BATCH_SIZE])
+            deleted.extend(pid for pid, state in result.get("deleted", {}).items() if state == "deleted")
+        return deleted
+
+
+class LocalPhotoStorage:
+    """Stand-in backend over a directory: ``<root>/students/abc.jpg`` is public_id ``students/abc``."""
+
+    def __init__(self, root: str, base_url: str = "/photos"):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    def upload(self, file: BinaryIO, folder: str, filename: str | None = None) -> tuple[str, str]:
+        public_id = f"{folder}/{uuid.uuid4().hex}"
+        extension = os.path.splitext(filename or "")[1].lower() or ".jpg"
+        path = os.path.join(self.root, public_id + extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as out:
+            shutil.copyfileobj(file, out)
+        return f"{self.base_url}/{public_id}{extension}", public_id
+
+    def delete(self, public_id: str) -> bool:
+        return bool(self.delete_many([public_id]))
+
+    def list_assets(self, prefix: str) -> Iterator[tuple[str, datetime]]:
+        base = os.path.join(self.root, prefix)
+        if not os.path.isdir(base):
+            return
+        for dirpath, _, filenames in os.walk(base):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                public_id = os.path.splitext(os.path.relpath(path, self.root))[0].replace(os.sep, "/")
+                yield public_id, datetime.fromtimestamp(os.path.getmtime(path), tz=timezone.utc)
+
+    def delete_many(self, public_ids: list[str]) -> list[str]:
+        deleted = []
+        for public_id in public_ids:
+            directory, name = os.path.split(os.path.join(self.root, public_id))
+            if not os.path.isdir(directory):
+                continue
+            for filename in os.listdir(directory):
+                if os.path.splitext(filename)[0] == name:
+                    os.remove(os.path.join(directory, filename))
+                    deleted.append(public_id)
+                    break
+        return deleted
@@ -0,0 +1,72 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from auth import verify_password
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+class PinVerifier:
+    """Runs bcrypt checks in a bounded process pool so they neither block the event loop nor hold the GIL."""
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool: ProcessPoolExecutor | None = None
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._restarts = 0
+
+    def start(self):
+        if self._pool is None:
+            # spawn: forking a process that already runs background threads is unsafe
+            self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def _restart(self):
+        broken, self._pool = self._pool, None
+        if broken is not None:
+            broken.shutdown(wait=False, cancel_futures=True)
+        self._restarts += 1
+        self.start()
+
+    async def verify(self, pin: str, pin_hash: str) -> bool:
+        # Only touched from the event loop thread, so the counters need no lock
+        if self._in_flight >= self.max_workers + self.max_queue:
+            self._rejected += 1
+            raise PoolSaturated()
+        self.start()
+        self._in_flight += 1
+        try:
+            pool = self._pool
+            try:
+                return await asyncio.get_running_loop().run_in_executor(pool, verify_password, pin, pin_hash)
+            except BrokenProcessPool:
+                # A worker died (OOM kill, crash) and every later submit would fail. Start a fresh pool
+                # unless a concurrent call already has, then retry once.
+                if self._pool is pool:
+                    self._restart()
+                return await asyncio.get_running_loop().run_in_executor(self._pool, verify_password, pin, pin_hash)
+        finally:
+            self._in_flight -= 1
+            self._completed += 1
+
+    def metrics(self) -> dict:
+        return {
+            "pool_size": self.max_workers,
+            "in_flight": self._in_flight,
+            "queue_depth": max(0, self._in_flight - self.max_workers),
+            "max_queue": self.max_queue,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "restarts": self._restarts,
+        }
@@ -0,0 +1,115 @@
+import struct
+import zlib
+from datetime import date
+from multiprocessing import shared_memory
+from typing import Iterable
+
+# Slot layout: day ordinal, crc32 of the roll, roll padded with NULs
+SLOT = struct.Struct("<II24s")
+MAX_PROBES = 32
+
+
+class PresenceSet:
+    """Open-addressed hash set of "(roll) marked today" in shared memory, visible to every worker.
+
+    Each slot carries the day it was written on, so entries from previous days read as empty
+    and the set resets itself at midnight without anyone clearing it. Writers take no lock:
+    a lost or torn write only makes a roll look absent, which sends the caller to the
+    database, never the other way round, because a hit needs both the roll bytes and
+    their checksum to match.
+    """
+
+    def __init__(self, name: str, capacity: int):
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=capacity * SLOT.size)
+            self._shm.buf[:] = bytes(len(self._shm.buf))
+        except FileExistsError:
+            self._shm = shared_memory.SharedMemory(name=name)
+        _untrack(self._shm)
+        self.capacity = self._shm.size // SLOT.size
+
+    def close(self, unlink: bool = False):
+        # Unlinking while other workers are attached is safe: they keep their mapping, and a worker
+        # started afterwards creates a fresh segment. Split sets only ever miss, which falls back to SQL.
+        self._shm.close()
+        if unlink:
+            _unlink(self._shm)
+
+    def _slots(self, key: bytes):
+        start = zlib.crc32(key) % self.capacity
+        for i in range(min(MAX_PROBES, self.capacity)):
+            yield (start + i) % self.capacity * SLOT.size
+
+    @staticmethod
+    def _key(roll: str) -> bytes | None:
+        key = roll.encode()
+        return key if len(key) <= 24 else None
+
+    def contains(self, roll: str, day: date) -> bool:
+        key = self._key(roll)
+        if key is None:
+            return False
+        today, crc = day.toordinal(), zlib.crc32(key)
+        buf = self._shm.buf
+        for offset in self._slots(key):
+            slot_day, slot_crc, slot_key = SLOT.unpack_from(buf, offset)
+            if slot_day != today:
+                return False
+            if slot_crc == crc and slot_key.rstrip(b"\0") == key:
+                return True
+        return False
+
+    def add(self, roll: str, day: date):
+        key = self._key(roll)
+        if key is None:
+            return
+        today, crc = day.toordinal(), zlib.crc32(key)
+        buf = self._shm.buf
+        for offset in self._slots(key):
+            slot_day, slot_crc, slot_key = SLOT.unpack_from(buf, offset)
+            if slot_day != today:
+                SLOT.pack_into(buf, offset, today, crc, key)
+                return
+            if slot_crc == crc and slot_key.rstrip(b"\0") == key:
+                return
+
+    def add_many(self, rolls: Iterable[str], day: date):
+        for roll in rolls:
+            self.add(roll, day)
+
+    def discard(self, roll: str, day: date):
+        # Zeroing the slot also hides later rolls in the same probe chain; they fall back to SQL
+        key = self._key(roll)
+        if key is None:
+            return
+        today, crc = day.toordinal(), zlib.crc32(key)
+        buf = self._shm.buf
+        for offset in self._slots(key):
+            slot_day, slot_crc, slot_key = SLOT.unpack_from(buf, offset)
+            if slot_day != today:
+                return
+            if slot_crc == crc and slot_key.rstrip(b"\0") == key:
+                SLOT.pack_into(buf, offset, 0, 0, b"")
+                return
+
+
+def _untrack(shm: shared_memory.SharedMemory):
+    # The segment outlives any single worker; stop the resource tracker from unlinking it on exit
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+
+
+def _unlink(shm: shared_memory.SharedMemory):
+    # SharedMemory.unlink() unregisters from the resource tracker again, which _untrack already did,
+    # and the tracker process then logs a KeyError; remove the segment directly instead
+    try:
+        import _posixshmem
+    except ImportError:
+        return  # Windows: the segment goes away with its last handle
+    try:
+        _posixshmem.shm_unlink(shm._name)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,58 @@
+# scheduler.py - in-process cron for the maintenance tasks
+from datetime import datetime, timedelta, timezone
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
+
+from jobs import acquire_lock, release_lock, run_recorded
+
+# How late a worker may still start a firing; the lease is held at least this long after it
+MISFIRE_GRACE_SECONDS = 300
+
+
+class MaintenanceScheduler:
+    """Runs maintenance jobs on cron expressions in a background thread.
+
+    Every uvicorn worker starts one; a lease row in task_locks makes sure only one of them
+    actually runs a given firing.
+    """
+
+    def __init__(self, jobs: dict, timezone: str | None = None, lock_ttl_seconds: int = 3600):
+        self.jobs = {name: (cron, func) for name, (cron, func) in jobs.items() if cron}
+        self.lock_ttl = timedelta(seconds=lock_ttl_seconds)
+        self._scheduler = BackgroundScheduler(timezone=timezone) if timezone else BackgroundScheduler()
+
+    def start(self):
+        for name, (cron, func) in self.jobs.items():
+            self._scheduler.add_job(
+                self._run_locked,
+                CronTrigger.from_crontab(cron, timezone=self._scheduler.timezone),
+                args=(name, func),
+                id=name,
+                max_instances=1,
+                coalesce=True,
+                misfire_grace_time=MISFIRE_GRACE_SECONDS,
+            )
+        self._scheduler.start()
+
+    def shutdown(self):
+        self._scheduler.shutdown(wait=False)
+
+    def _run_locked(self, name: str, func):
+        fired_at = datetime.utcnow()
+        if not acquire_lock(name, self.lock_ttl):
+            return
+        try:
+            run_recorded(name, "schedule", func)
+        finally:
+            release_lock(name, self._firing_ends(name, fired_at))
+
+    def _firing_ends(self, name: str, fired_at: datetime) -> datetime:
+        # Other workers can still start this firing up to the misfire grace after it; keep them
+        # out until then, but never into the job's next firing
+        ends = fired_at + timedelta(seconds=MISFIRE_GRACE_SECONDS)
+        job = self._scheduler.get_job(name)
+        if job and job.next_run_time:
+            next_run = job.next_run_time.astimezone(timezone.utc).replace(tzinfo=None)
+            ends = min(ends, next_run - timedelta(seconds=1))
+        return ends
@@ -1,5 +1,5 @@
 # schemas.py
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import date
 from typing import Optional
 
@@ -44,7 +44,25 @@ class AttendanceOut(AttendanceBase):
 
 
 class MarkAttendance(BaseModel):
-    roll: str
+    # Lengths of the attendance columns; longer values would fail the insert
+    roll: str = Field(max_length=20)
     date: date
-    time: str
+    time: str = Field(max_length=20)
+
+
+class MarkAttendanceWithPin(MarkAttendance):
+    pin: str
+
 
+# ----------------- Calendar -----------------
+class HolidayCreate(BaseModel):
+    date: date
+    branch: Optional[str] = None
+    name: Optional[str] = None
+
+
+class HolidayOut(HolidayCreate):
+    id: int
+
+    class Config:
+        orm_mode = True
@@ -0,0 +1,245 @@
+# tasks.py - maintenance work behind the /tasks endpoints, split into per-branch shards
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+import crud
+import partitions
+from database import SessionLocal, engine
+from models import ATTENDANCE_PARTITIONED
+
+
+def shard_workers(requested: int) -> int:
+    # SQLite allows one writer at a time; parallel shards would only fight over the lock
+    return 1 if engine.dialect.name == "sqlite" else max(1, requested)
+
+
+def run_sharded(work, shards: list[str], max_workers: int, progress=None, rows_key: str | None = None) -> list[dict]:
+    """Run ``work(db, shard)`` for every shard on its own pooled session.
+
+    A shard that raises is rolled back and reported with its error; the other shards carry on.
+    ``progress(done, total, rows)`` is called as shards finish, summing ``rows_key`` of their results.
+    """
+    def run(shard):
+        started = time.perf_counter()
+        db = SessionLocal()
+        try:
+            result = work(db, shard)
+            db.commit()
+            return {"shard": shard, **result, "error": None, "elapsed_ms": _elapsed_ms(started)}
+        except Exception as e:
+            db.rollback()
+            return {"shard": shard, "error": str(e), "elapsed_ms": _elapsed_ms(started)}
+        finally:
+            db.close()
+
+    results = {}
+    rows = 0
+    with ThreadPoolExecutor(max_workers=shard_workers(max_workers)) as pool:
+        futures = {pool.submit(run, shard): shard for shard in shards}
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            rows += result.get(rows_key, 0) if rows_key else 0
+            if progress:
+                progress(len(results), len(shards), rows)
+    return [results[shard] for shard in shards]
+
+
+def branch_shards() -> list[str]:
+    db = SessionLocal()
+    try:
+        return crud.branches(db)
+    finally:
+        db.close()
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+# ===== Mark absent =====
+
+
+def mark_absent_work(days: list[date]):
+    def work(db, branch):
+        per_day = []
+        for day in days:
+            inserted = crud.mark_absent(db, day, branch)
+            db.commit()
+            per_day.append(inserted)
+        return {"inserted": sum(per_day), "per_day": per_day}
+    return work
+
+
+def mark_absent(days: list[date], max_workers: int, progress=None) -> dict:
+    shards = run_sharded(mark_absent_work(days), branch_shards(), max_workers, progress, "inserted")
+    per_day = [0] * len(days)
+    for shard in shards:
+        for i, inserted in enumerate(shard.pop("per_day", [])):
+            per_day[i] += inserted
+    return {
+        "inserted": sum(per_day),
+        "days": [{"date": day, "inserted": inserted} for day, inserted in zip(days, per_day)],
+        "shards": shards,
+    }
+
+
+# ===== Expired students =====
+
+
+def delete_expired_work(today: date, chunk_size: int, archive=None):
+    def work(db, branch):
+        backfilled = crud.backfill_valid_until(db, branch)
+        deleted_rolls = []
+        photo_ids = []
+        attendance_deleted = 0
+        while True:
+            expired = crud.expired_students(db, today, branch, chunk_size)
+            if not expired:
+                break
+            rolls = [roll for roll, _ in expired]
+            if archive:
+                archive.write_students(crud.student_rows(db, rolls), today)
+                archive.write_attendance(crud.attendance_rows_for(db, rolls))
+            students, attendance = crud.delete_students(db, rolls)
+            db.commit()
+            deleted_rolls.extend(rolls)
+            photo_ids.extend(photo for _, photo in expired if photo)
+            attendance_deleted += attendance
+        return {
+            "deleted": len(deleted_rolls),
+            "attendance_deleted": attendance_deleted,
+            "backfilled": backfilled,
+            "deleted_rolls": deleted_rolls,
+            "photo_ids": photo_ids,
+        }
+    return work
+
+
+def delete_expired_students(today: date, max_workers: int, chunk_size: int, progress=None, archive=None) -> dict:
+    shards = run_sharded(delete_expired_work(today, chunk_size, archive), branch_shards(), max_workers, progress, "deleted")
+    deleted_rolls = []
+    photo_ids = []
+    for shard in shards:
+        deleted_rolls.extend(shard.pop("deleted_rolls", []))
+        photo_ids.extend(shard.pop("photo_ids", []))
+    return {
+        "deleted": len(deleted_rolls),
+        "attendance_deleted": sum(shard.get("attendance_deleted", 0) for shard in shards),
+        "deleted_rolls": deleted_rolls,
+        "photo_ids": photo_ids,
+        "shards": shards,
+    }
+
+
+# ===== Old attendance =====
+
+
+def cleanup_old_attendance(cutoff: date, chunk_size: int, pause_ms: int = 0, after_id: int = 0, progress=None, archive=None) -> dict:
+    """Roll up and delete attendance older than ``cutoff`` in primary-key ranges of ``chunk_size`` rows.
+
+    Each range is its own transaction, with an optional pause between ranges so kiosk writes
+    are not starved. ``after_id`` resumes a run that stopped part-way. On a partitioned table
+    whole months before the cutoff are dropped first and only the partial month is deleted row-wise.
+    With an ``archive`` every row is written there before it is deleted.
+    """
+    dropped, dropped_rows = drop_expired_partitions(cutoff, archive) if ATTENDANCE_PARTITIONED else ([], 0)
+    db = SessionLocal()
+    last_id = after_id
+    deleted_count = 0
+    chunks = 0
+    try:
+        total = crud.count_attendance_before(db, cutoff, after_id)
+        while True:
+            ids = crud.attendance_ids_before(db, cutoff, last_id, chunk_size)
+            if not ids:
+                break
+            # Archived and rolled up from exactly what was deleted, before the same transaction commits
+            rows = crud.delete_attendance_range(db, cutoff, ids[0], ids[-1])
+            if archive:
+                archive.write_attendance(rows)
+            crud.rollup_attendance_rows(db, rows)
+            deleted_count += len(rows)
+            db.commit()
+            last_id = ids[-1]
+            chunks += 1
+            if progress:
+                progress(min(deleted_count, total), total, deleted_count)
+            if pause_ms:
+                time.sleep(pause_ms / 1000)
+    except Exception as e:
+        db.rollback()
+        raise RuntimeError(f"Stopped after id {last_id} ({deleted_count} rows deleted); resume with after_id={last_id}: {e}")
+    finally:
+        db.close()
+    return {
+        "deleted": deleted_count + dropped_rows,
+        "chunks": chunks,
+        "last_id": last_id,
+        "partitions_dropped": dropped,
+    }
+
+
+def drop_expired_partitions(cutoff: date, archive=None) -> tuple[list[str], int]:
+    dropped = []
+    rows = 0
+    with engine.connect() as conn:
+        expired = partitions.expired_partitions(conn, cutoff)
+    for name, month in expired:
+        if archive:
+            archive_partition(name, archive)
+        with engine.begin() as conn:
+            rows += conn.execute(text(f"SELECT count(*) FROM {name}")).scalar_one()
+            partitions.rollup_partition(conn, name)
+            partitions.drop_partition(conn, name)
+        dropped.append(name)
+    return dropped, rows
+
+
+def archive_partition(name: str, archive, batch_size: int = 10000):
+    # Server-side cursor: the partition is streamed to the archive, never loaded whole
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+            text(f"SELECT id, roll, date, time, arrival_time, late, status FROM {name}")
+        )
+        for batch in result.mappings().partitions():
+            archive.write_attendance([dict(row) for row in batch])
+
+# ===== Photos =====
+
+
+def reconcile_photos(storage, prefix: str, grace: timedelta, dry_run: bool = False, batch_size: int = 100, progress=None) -> dict:
+    """Delete stored photos under ``prefix`` that no student references.
+
+    Assets younger than ``grace`` are left alone: create_student uploads before it commits.
+    """
+    db = SessionLocal()
+    try:
+        referenced = crud.photo_public_ids(db)
+    finally:
+        db.close()
+    newest = datetime.now(timezone.utc) - grace
+    scanned = 0
+    orphans = 0
+    deleted = 0
+    pending = []
+    for public_id, created_at in storage.list_assets(prefix):
+        scanned += 1
+        if public_id in referenced or created_at > newest:
+            continue
+        orphans += 1
+        pending.append(public_id)
+        if not dry_run and len(pending) >= batch_size:
+            deleted += len(storage.delete_many(pending))
+            pending = []
+            if progress:
+                progress(scanned, scanned, deleted)
+    if not dry_run and pending:
+        deleted += len(storage.delete_many(pending))
+    if progress:
+        progress(scanned, scanned, deleted)
+    return {"scanned": scanned, "orphans": orphans, "deleted": deleted, "dry_run": dry_run}
+
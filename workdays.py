@@ -0,0 +1,24 @@
+# workdays.py - which days count as college days for absence marking
+import os
+from datetime import date, timedelta
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Monday=0 ... Sunday=6; Monday to Saturday by default
+WORKING_WEEKDAYS = {int(d) for d in os.getenv("WORKING_WEEKDAYS", "0,1,2,3,4,5").split(",") if d.strip()}
+
+
+def is_working_day(day: date) -> bool:
+    return day.weekday() in WORKING_WEEKDAYS
+
+
+def working_days(start: date, end: date, holidays: set[date] = frozenset()) -> list[date]:
+    days = []
+    day = start
+    while day <= end:
+        if is_working_day(day) and day not in holidays:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
@@ -0,0 +1,140 @@
+import queue
+import threading
+import time
+from datetime import date
+
+import crud
+from database import SessionLocal
+from models import Attendance
+
+# Checked before a row is queued: a too-long value would otherwise only fail at flush time
+COLUMN_LENGTHS = {name: Attendance.__table__.c[name].type.length for name in ("roll", "time")}
+
+
+class BufferFull(Exception):
+    pass
+
+
+class AttendanceWriteBuffer:
+    """Group-commit buffer: marks are queued in memory and a background thread
+    writes them with one insert and one commit per batch."""
+
+    def __init__(
+        self,
+        flush_interval_ms: int = 200,
+        max_batch: int = 500,
+        max_pending: int = 10000,
+        put_timeout_ms: int = 1000,
+        on_drop=None,
+    ):
+        self.flush_interval = flush_interval_ms / 1000
+        self.on_drop = on_drop  # Called with each row that could not be written
+        self.max_batch = max_batch
+        self.put_timeout = put_timeout_ms / 1000
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._pending: set[tuple[str, date]] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="attendance-flusher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        # Drains whatever is still queued before returning
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def is_pending(self, roll: str, day: date) -> bool:
+        with self._lock:
+            return (roll, day) in self._pending
+
+    def submit(self, row: dict) -> bool:
+        """Queue a row; False if the same (roll, date) is already waiting to be written.
+
+        Blocks up to ``put_timeout`` when the queue is full and then raises BufferFull,
+        so callers see backpressure instead of unbounded memory growth. Raises ValueError
+        for a row the database would reject for its length.
+        """
+        for name, length in COLUMN_LENGTHS.items():
+            if len(row[name]) > length:
+                raise ValueError(f"{name} is longer than {length} characters")
+        key = (row["roll"], row["date"])
+        with self._lock:
+            if key in self._pending:
+                return False
+            self._pending.add(key)
+        try:
+            self._queue.put(row, timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self._pending.discard(key)
+            raise BufferFull()
+        return True
+
+    def _next_batch(self) -> list[dict]:
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+
+    def _flush(self, batch: list[dict], attempts: int = 3):
+        for attempt in range(1, attempts + 1):
+            db = SessionLocal()
+            try:
+                crud.upsert_present(db, batch)
+                db.commit()
+                break
+            except Exception as e:
+                db.rollback()
+                if attempt == attempts:
+                    # Usually a single bad row; write the rest one at a time so only it is lost
+                    print(f"Batch of {len(batch)} buffered attendance marks failed, writing row by row: {e}")
+                    self._flush_rows(batch)
+                else:
+                    time.sleep(0.1 * attempt)
+            finally:
+                db.close()
+        with self._lock:
+            for row in batch:
+                self._pending.discard((row["roll"], row["date"]))
+
+    def _flush_rows(self, batch: list[dict]):
+        dropped = []
+        db = SessionLocal()
+        try:
+            for row in batch:
+                try:
+                    with db.begin_nested():
+                        crud.upsert_present(db, [row])
+                except Exception as e:
+                    print(f"Dropping buffered attendance mark for {row['roll']} on {row['date']}: {e}")
+                    dropped.append(row)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Dropping {len(batch)} buffered attendance marks: {e}")
+            dropped = batch
+        finally:
+            db.close()
+        if self.on_drop:
+            for row in dropped:
+                self.on_drop(row)